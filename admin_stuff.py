@@ -1,10 +1,11 @@
-import requests
+import asyncio
 import json
 
 from multiprocessing.queues import Queue
 
 from repo import Repo
 from utils import Utils
+from metrics import instrumented
 
 
 class Admin:
@@ -37,6 +38,9 @@ class Admin:
             "generic_ws": {
                 "target": self.generic
             },
+            "set_ingress_filter": {
+                "target": self.set_ingress_filter
+            },
             "close_connection": {
                 "target": self.close_connection
             },
@@ -45,12 +49,14 @@ class Admin:
             }
         }
 
+    @instrumented
     def dispatch(self, action: dict):
         """
         Method for dispatching actions from the primary handler to Admin methods
         :param action: Action dict with format:
             {target: "admin", action: "dispatch map key", payload: {payload}, source: "source"}
         :type action: dict
+        :return: The target's return value. A coroutine for async targets, which the router's ModuleWorker awaits.
         """
 
         target_dict = self.dispatch_map.get(action["action"], None)
@@ -59,7 +65,7 @@ class Admin:
             print(f"Admin dispatch error: No handler for {action['action']}")
             return
 
-        target_dict["target"](action)
+        return target_dict["target"](action)
 
     def speak(self, action: dict):
         """
@@ -98,21 +104,24 @@ class Admin:
         else:
             print("admin_stuff error: Invalid source for send.")
 
-    def update_cheaters(self, action: dict):
+    async def update_cheaters(self, action: dict):
         """
         Updates database permissions to give -2 (blacklisted for cheating) to users from Nades's dataset
         :param action: (Unused) Action dict
         :type action: dict
         """
+        import aiohttp
+
         url = 'https://raw.githubusercontent.com/GodofNades/idle-pixel/main/AltTraders.json'
-        resp = requests.get(url)
-        data = json.loads(resp.text)
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as resp:
+                data = json.loads(await resp.text())
 
         cheater_list = []
         for data_point in data:
             cheater_list.append(data_point["name"])
 
-        self.db.set_cheaters_permissions({"cheater_list": cheater_list})
+        await asyncio.to_thread(self.db.set_cheaters_permissions, {"cheater_list": cheater_list})
 
     def update_permissions(self, action: dict):
         """
@@ -215,6 +224,42 @@ class Admin:
 
         self.p_q.put(action)
 
+    def set_ingress_filter(self, action: dict):
+        """
+        Changes how the game process filters a type of received frame, see ingress.INGRESS_FILTERS
+        :param action: Action dict with format:
+            {
+                payload: {
+                    parsed_command: {
+                        payload: "frame type;rule" eg "UPDATE_TIMER;sample:60",
+                        ...
+                    },
+                    ...
+                },
+                source: "source",
+                ...
+            }
+        :type action: dict
+        """
+        message = action["payload"]
+        parsed_command = message["parsed_command"]
+        payload = parsed_command["payload"]
+
+        if payload is None or len(payload.split(";")) != 2:
+            print(f"Invalid ingress filter format: {payload}")
+            return
+
+        frame_type, rule = payload.split(";")
+
+        action = {
+            "target": "game",
+            "action": "set_ingress_filter",
+            "payload": {"type": frame_type.strip(), "filter": rule.strip()},
+            "source": action["source"],
+        }
+
+        self.p_q.put(action)
+
     def close_connection(self, action: dict):
         """
         Sends a close or restart instruction up to the primary handler.
@@ -222,7 +267,8 @@ class Admin:
             {
                 payload: {
                     parsed_command: {
-                        payload: "close" OR "restart",
+                        payload: "close" OR "restart", optionally followed by ";connection id" to only affect one
+                            game connection,
                         ...
                     },
                     ...
@@ -234,21 +280,21 @@ class Admin:
         """
         message = action["payload"]
         parsed_command = message["parsed_command"]
-        payload = parsed_command["payload"]
+        payload, _, connection_id = (parsed_command["payload"] or "").partition(";")
         message_source = action["source"]
 
         if payload == "close":
             action = {
                 "target": "main",
                 "action": "main_close",
-                "payload": "",
+                "payload": connection_id.strip(),
                 "source": message_source,
             }
         elif payload == "restart":
             action = {
                 "target": "main",
                 "action": "main_restart",
-                "payload": "",
+                "payload": connection_id.strip(),
                 "source": message_source,
             }
         else:
@@ -1,13 +1,13 @@
 import os
 import queue
-import discord
-import aiohttp
 import asyncio
-import requests
 
 from multiprocessing.queues import Queue
 
+import tracing
+
 from utils import Utils
+from metrics import instrumented, registry
 
 
 class APIs:
@@ -49,6 +49,7 @@ class APIs:
 
         return env_const_dict
 
+    @instrumented
     async def dispatch(self, action: dict):
         action_target = self.dispatch_map.get(action["action"], None)
 
@@ -62,6 +63,10 @@ class APIs:
         message = action["payload"]
         hook_url = self.env_consts["DISCORD_CHAT_WEBHOOK_URL"]
 
+        # discord and aiohttp take a good part of a second to import, so they wait until the first webhook.
+        import aiohttp
+        import discord
+
         message = message.replace("@mods", "<@&291724449340719104>", 1)
         allowed = discord.AllowedMentions(everyone=False, users=False,
                                           roles=[discord.Object(id="291724449340719104", type=discord.Role)])
@@ -74,6 +79,9 @@ class APIs:
         message = action["payload"]
         hook_url = self.env_consts["DISCORD_EVENT_WEBHOOK_URL"]
 
+        import aiohttp
+        import discord
+
         allowed = discord.AllowedMentions(everyone=False, users=False,
                                           roles=[discord.Object(id="1142985685184282705", type=discord.Role)])
 
@@ -98,6 +106,8 @@ class APIs:
             'Content-Type': 'application/json',
         }
 
+        import requests
+
         response = requests.post('https://data.idle-pixel.com/api/paste/', headers=headers, json=body)
         paste_url = f"https://data.idle-pixel.com/api/paste/?paste_id={response.text[1:-1]}"
         reply_message = message_wrapper.replace("{{url}}", paste_url)
@@ -116,9 +126,12 @@ class APIs:
             print("stats_stuff error: Invalid source for send.")
 
     def run(self):
+        registry.start_flushing("api")
+
         while True:
             try:
                 new_action = self.api_queue.get(False)
-                asyncio.run(self.dispatch(new_action))
+                with tracing.activate(new_action.get("trace", None)):
+                    asyncio.run(self.dispatch(new_action))
             except queue.Empty:
                 pass
@@ -0,0 +1,246 @@
+"""
+Archive of every websocket frame the Game processes receive and send.
+
+Frames are grouped into blocks of up to BLOCK_FRAMES (or BLOCK_SECONDS worth), each compressed with zlib and appended
+to a segment file. A new segment starts each day, or once the current one reaches SEGMENT_BYTES. Every segment has a
+sidecar index with one JSON line per block: its offset and length in the segment, the first and last frame times,
+and how many frames of each type it holds. Reads only decompress the blocks whose times and types match, straight
+out of a memory map of the segment.
+
+To pull frames out, eg all YELLs from a day, as lines benchmarks/replay.py can replay:
+    python archive.py --type YELL --since 2026-10-13 --until 2026-10-14 > yells.jsonl
+"""
+import os
+import json
+import mmap
+import time
+import zlib
+import argparse
+
+from datetime import date, datetime
+
+import rel
+
+from metrics import registry
+
+# Directory the Game processes archive to.
+ARCHIVE_DIR = os.environ.get("LUXBOT_ARCHIVE_DIR", "archive")
+# A block is compressed and written once it holds this many frames, or this many seconds after its first frame.
+BLOCK_FRAMES = 512
+BLOCK_SECONDS = 5
+# Size past which a new segment is started, even within a day.
+SEGMENT_BYTES = 64 * 1024 * 1024
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+
+
+def frame_type(frame: str) -> str:
+    return frame.split("=", 1)[0]
+
+
+class FrameArchive:
+    """Appends a Game process' frames to its segments. Runs on the Game process' rel thread."""
+    def __init__(self, connection_id: str, directory: str = None):
+        """
+        :param connection_id: Game connection the frames belong to, part of each segment's name.
+        :param directory: Where segments go. Defaults to ARCHIVE_DIR.
+        """
+        self.connection_id = connection_id
+        self.directory = directory or ARCHIVE_DIR
+        self.block = []
+        self.types = {}
+        self.timer_set = False
+        self.segment = None
+        self.index = None
+        self.segment_day = None
+        self.counters = {"frames": 0, "blocks": 0, "segments": 0, "raw_bytes": 0, "compressed_bytes": 0}
+
+        os.makedirs(self.directory, exist_ok=True)
+        registry.add_sampler(self.sample_metrics)
+
+    def append(self, direction: str, frame: str):
+        """
+        :param direction: "in" for received frames, "out" for sent ones.
+        """
+        self.block.append((time.time_ns(), direction, frame))
+
+        current_type = frame_type(frame)
+        self.types[current_type] = self.types.get(current_type, 0) + 1
+
+        if len(self.block) >= BLOCK_FRAMES:
+            self.write_block()
+        elif not self.timer_set:
+            self.timer_set = True
+            rel.timeout(BLOCK_SECONDS, self.on_timer)
+
+    def on_timer(self):
+        self.timer_set = False
+        if self.block:
+            self.write_block()
+
+    def write_block(self):
+        block, types = self.block, self.types
+        self.block, self.types = [], {}
+
+        raw = "\n".join(json.dumps(record) for record in block).encode()
+        compressed = zlib.compress(raw)
+
+        try:
+            self.open_segment(block[0][0])
+            offset = self.segment.tell()
+            self.segment.write(compressed)
+            self.segment.flush()
+
+            entry = {
+                "offset": offset,
+                "length": len(compressed),
+                "start": block[0][0],
+                "end": block[-1][0],
+                "frames": len(block),
+                "types": types,
+            }
+            self.index.write(json.dumps(entry) + "\n")
+            self.index.flush()
+        except OSError as e:
+            print(f"Couldn't archive {len(block)} frames: {e}")
+            return
+
+        self.counters["frames"] += len(block)
+        self.counters["blocks"] += 1
+        self.counters["raw_bytes"] += len(raw)
+        self.counters["compressed_bytes"] += len(compressed)
+
+    def open_segment(self, first_time: int):
+        """Starts a new segment if there is none yet, the day has changed or the current one is full."""
+        day = date.fromtimestamp(first_time / 1e9)
+
+        if self.segment is not None and self.segment_day == day and self.segment.tell() < SEGMENT_BYTES:
+            return
+
+        self.close_segment()
+
+        base = os.path.join(self.directory, f"{self.connection_id}-{first_time}")
+        self.segment = open(base + SEGMENT_SUFFIX, "ab")
+        self.index = open(base + INDEX_SUFFIX, "a")
+        self.segment_day = day
+        self.counters["segments"] += 1
+
+    def close(self):
+        """Writes out the pending block and closes the current segment. Called when the Game process stops."""
+        if self.block:
+            self.write_block()
+
+        self.close_segment()
+
+    def close_segment(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.index.close()
+            self.segment = self.index = None
+
+    def sample_metrics(self) -> dict:
+        return {"archive": dict(self.counters, pending=len(self.block))}
+
+
+def list_segments(directory: str, connection_id: str = None) -> list[tuple[str, str, int]]:
+    """(connection id, segment base path, first frame time) for each segment, oldest first."""
+    segments = []
+
+    for name in os.listdir(directory):
+        if not name.endswith(SEGMENT_SUFFIX):
+            continue
+
+        segment_connection, _, first_time = name[:-len(SEGMENT_SUFFIX)].rpartition("-")
+        if connection_id is not None and segment_connection != connection_id:
+            continue
+
+        segments.append((segment_connection, os.path.join(directory, name[:-len(SEGMENT_SUFFIX)]), int(first_time)))
+
+    segments.sort(key=lambda segment: segment[2])
+
+    return segments
+
+
+def read_index(base: str) -> list[dict]:
+    try:
+        with open(base + INDEX_SUFFIX) as index:
+            return [json.loads(line) for line in index if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def read_frames(directory: str = None, start: int = None, end: int = None, types: set = None, direction: str = None,
+                connection_id: str = None):
+    """
+    Yields archived frames as (time_ns, connection id, direction, frame), oldest first within each segment.
+
+    :param start: Earliest frame time, in ns since the epoch.
+    :param end: Latest frame time, in ns since the epoch.
+    :param types: Frame types to include, eg {"YELL"}. All if not given.
+    :param direction: "in" or "out". Both if not given.
+    :param connection_id: Connection to include. All if not given.
+    """
+    directory = directory or ARCHIVE_DIR
+
+    for segment_connection, base, first_time in list_segments(directory, connection_id):
+        if end is not None and first_time > end:
+            continue
+
+        blocks = [
+            block for block in read_index(base)
+            if (start is None or block["end"] >= start)
+            and (end is None or block["start"] <= end)
+            and (types is None or not types.isdisjoint(block["types"]))
+        ]
+        if not blocks:
+            continue
+
+        with open(base + SEGMENT_SUFFIX, "rb") as segment, \
+                mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for block in blocks:
+                raw = zlib.decompress(mapped[block["offset"]:block["offset"] + block["length"]])
+
+                for line in raw.split(b"\n"):
+                    # Records are [time, direction, frame] as written by json.dumps. The time, direction and type
+                    # are sliced out, so only matching frames are decoded.
+                    time_end = line.index(b",")
+                    frame_time = int(line[1:time_end])
+                    if start is not None and frame_time < start or end is not None and frame_time > end:
+                        continue
+
+                    direction_end = line.index(b'"', time_end + 3)
+                    frame_direction = line[time_end + 3:direction_end].decode()
+                    if direction is not None and frame_direction != direction:
+                        continue
+
+                    encoded_frame = line[direction_end + 3:-1]
+                    if types is not None and frame_type(encoded_frame[1:-1].decode()) not in types:
+                        continue
+
+                    yield frame_time, segment_connection, frame_direction, json.loads(encoded_frame)
+
+
+def parse_time(value: str) -> int:
+    """ISO date or datetime, in local time, to ns since the epoch."""
+    return int(datetime.fromisoformat(value).timestamp() * 1e9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=ARCHIVE_DIR)
+    parser.add_argument("--type", action="append", help="Frame type to include. Can be given more than once.")
+    parser.add_argument("--since", type=parse_time, help="ISO date or datetime, local time")
+    parser.add_argument("--until", type=parse_time, help="ISO date or datetime, local time")
+    parser.add_argument("--direction", choices=("in", "out"))
+    parser.add_argument("--connection")
+    args = parser.parse_args()
+
+    types = set(args.type) if args.type else None
+
+    for frame_time, connection_id, _, frame in read_frames(args.dir, args.since, args.until, types, args.direction,
+                                                           args.connection):
+        print(json.dumps({"time": frame_time, "frame": frame, "connection": connection_id}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Compares the size and encode/decode cost of actions crossing a process boundary:
+the old dict + pickle path (as Manager/multiprocessing queues pickled them) vs the transport Action record codec.
+
+Usage: python -m benchmarks.codec_bench [--rounds 20000]
+"""
+import argparse
+import pickle
+import time
+
+from datetime import datetime
+
+from transport import encode_action, decode_action
+
+
+def sample_actions(time_value) -> dict:
+    set_items = "~".join(f"var_{i}~{i * 37}" for i in range(400))
+
+    return {
+        "chat frame": {
+            "target": "ws_handlers",
+            "action": "dispatch",
+            "payload": {"type": "CHAT", "payload": "luxferre~0~none~2412~!luxbot:pet bear", "time": time_value},
+            "source": "game",
+        },
+        "chat reply": {
+            "target": "game",
+            "action": "send_ws_message",
+            "payload": "CHAT=Luxferre, your random pet is Bear! Bear: https://prnt.sc/abc123",
+            "source": "chat",
+        },
+        "discord mirror": {
+            "target": "api",
+            "action": "chat_mirror_webhook",
+            "payload": "*[<t:1700000000:t>]* **luxferre:** hello there ",
+            "source": "integration",
+        },
+        "SET_ITEMS frame": {
+            "target": "ws_handlers",
+            "action": "dispatch",
+            "payload": {"type": "SET_ITEMS", "payload": set_items, "time": time_value},
+            "source": "game",
+        },
+    }
+
+
+def time_per_call(func, arg, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(arg)
+    return (time.perf_counter() - start) / rounds * 1000000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=20000)
+    args = parser.parse_args()
+
+    old_actions = sample_actions(datetime.now())
+    new_actions = sample_actions(time.time_ns())
+
+    def pickle_dumps(action):
+        return pickle.dumps(action, pickle.HIGHEST_PROTOCOL)
+
+    for name, old_action in old_actions.items():
+        new_action = new_actions[name]
+
+        old_bytes = pickle_dumps(old_action)
+        new_bytes = encode_action(new_action)
+
+        old_encode = time_per_call(pickle_dumps, old_action, args.rounds)
+        old_decode = time_per_call(pickle.loads, old_bytes, args.rounds)
+        new_encode = time_per_call(encode_action, new_action, args.rounds)
+        new_decode = time_per_call(decode_action, new_bytes, args.rounds)
+
+        print(f"{name}:")
+        print(f"    dict + pickle: {len(old_bytes):>6} B | encode {old_encode:6.2f} us | decode {old_decode:6.2f} us")
+        print(f"    Action codec:  {len(new_bytes):>6} B | encode {new_encode:6.2f} us | decode {new_decode:6.2f} us")
+
+
+if __name__ == '__main__':
+    main()
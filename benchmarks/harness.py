@@ -0,0 +1,181 @@
+"""
+Runs the primary pipeline (Router, its workers and every handler module) in this process, against a stub game socket
+and a stub API process, so recorded or synthetic traffic can be pushed through it and measured.
+
+Shared by benchmarks/replay.py and benchmarks/loadgen.py.
+"""
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from threading import Thread
+
+from idle_pixel_bot import Game
+from metrics import registry
+from router import Router
+from transport import ActionQueue
+from utils import Utils
+
+import tracing
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+
+    index = min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+class StubGame(Thread):
+    """Stands in for the Game process: collects outbound frames and their receive-to-send latency per command."""
+    def __init__(self, game_queue: ActionQueue):
+        super().__init__(name="stub_game", daemon=True)
+        self.game_queue = game_queue
+        self.sent_frames = []
+        self.latencies = {}
+
+    def run(self):
+        while True:
+            action = self.game_queue.get()
+            if action["action"] != "send_ws_message":
+                continue
+
+            self.sent_frames.append(action["payload"])
+
+            trace = action.get("trace", None)
+            if trace is not None:
+                command = trace["command"] or "no_command"
+                self.latencies.setdefault(command, []).append(tracing.elapsed_ms(trace))
+
+
+class StubAPI(Thread):
+    """Stands in for the APIs process: webhooks are counted, pastes are answered with a dummy url like APIs.paste."""
+    def __init__(self, p_q: ActionQueue, api_queue: ActionQueue):
+        super().__init__(name="stub_api", daemon=True)
+        self.p_q = p_q
+        self.api_queue = api_queue
+        self.calls = {}
+
+    def run(self):
+        while True:
+            action = self.api_queue.get()
+            self.calls[action["action"]] = self.calls.get(action["action"], 0) + 1
+
+            if action["action"] != "paste":
+                continue
+
+            reply_data = {
+                "player": action["payload"]["player"],
+                "payload": action["payload"]["wrapper"].replace("{{url}}", "https://data.idle-pixel.com/api/paste/?paste_id=stub"),
+                "command": action["payload"]["command"],
+            }
+
+            with tracing.activate(action.get("trace", None)):
+                self.p_q.put(Utils.gen_send_action("chat", reply_data))
+
+
+class PipelineHarness:
+    def __init__(self, db_path: str):
+        """
+        :param db_path: Database to run against. A temporary copy is used, so replays don't touch the real stats.
+        :type db_path: str
+        """
+        self.temp_dir = tempfile.mkdtemp(prefix="luxbot_bench_")
+        self.db_copy = os.path.join(self.temp_dir, "configs.db")
+        shutil.copyfile(db_path, self.db_copy)
+        os.environ["LUXBOT_DB"] = self.db_copy
+
+        self.p_q = ActionQueue()
+        self.game_queue = ActionQueue()
+        self.api_queue = ActionQueue()
+
+        self.router = Router(self.p_q, {"game:main": self.game_queue, "api": self.api_queue})
+        self.router.add_route("main", self.ignore)
+
+        self.stub_game = StubGame(self.game_queue)
+        self.stub_api = StubAPI(self.p_q, self.api_queue)
+
+    @staticmethod
+    def ignore(action: dict):
+        pass
+
+    def start(self):
+        Thread(target=self.router.run, name="router", daemon=True).start()
+        self.stub_game.start()
+        self.stub_api.start()
+
+    def inject(self, raw_frame: str, connection_id: str = "main"):
+        """Puts a frame on the primary queue exactly as Game.on_ws_message would."""
+        self.p_q.put(Game.build_frame_action(raw_frame, connection_id))
+
+    def is_idle(self) -> bool:
+        router = self.router
+        return (
+            self.p_q.qsize() == 0
+            and not router.inbox
+            and all(worker.inbox.empty() for worker in router.workers.values())
+            and not any(router.outboxes.values())
+            and self.game_queue.qsize() == 0
+            and self.api_queue.qsize() == 0
+        )
+
+    def wait_idle(self, timeout: float = 60, settle: float = 0.05):
+        """Blocks until every queue in the pipeline has stayed empty for ``settle`` seconds."""
+        deadline = time.monotonic() + timeout
+        idle_since = None
+
+        while time.monotonic() < deadline:
+            if self.is_idle():
+                idle_since = idle_since or time.monotonic()
+                if time.monotonic() - idle_since >= settle:
+                    return
+            else:
+                idle_since = None
+            time.sleep(0.005)
+
+        print(f"Pipeline still busy after {timeout}s")
+
+    def report(self) -> dict:
+        latencies = {}
+        for command, values in self.stub_game.latencies.items():
+            values = sorted(values)
+            latencies[command] = {
+                "count": len(values),
+                "p50_ms": round(statistics.median(values), 3),
+                "p99_ms": round(percentile(values, 99), 3),
+                "max_ms": round(values[-1], 3),
+            }
+
+        snapshot = registry.snapshot()
+
+        return {
+            "sent_frames": len(self.stub_game.sent_frames),
+            "api_calls": dict(self.stub_api.calls),
+            "reply_latency": latencies,
+            "dispatch": snapshot["dispatch"],
+            "queues": snapshot["gauges"]["queues"],
+        }
+
+    def close(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+def print_report(report: dict, frames: int, elapsed: float):
+    print(f"Frames: {frames} in {elapsed:.3f}s ({frames / elapsed:.0f} frames/s)")
+    print(f"Outbound frames: {report['sent_frames']} | API calls: {report['api_calls']}")
+
+    print("Reply latency (receive -> send):")
+    for command, latency in sorted(report["reply_latency"].items()):
+        print(f"    {command:>24}: n={latency['count']:<6} p50 {latency['p50_ms']:>9} ms | p99 {latency['p99_ms']:>9} ms")
+
+    print("Busiest handlers:")
+    busiest = sorted(report["dispatch"].items(), key=lambda item: item[1]["total_ms"], reverse=True)[:10]
+    for key, dispatch_stats in busiest:
+        print(f"    {key:>36}: n={dispatch_stats['count']:<6} total {dispatch_stats['total_ms']:>10} ms | p99 {dispatch_stats['p99_ms']} ms")
+
+    print("Queue high-water marks:")
+    for name, queue_stats in report["queues"].items():
+        print(f"    {name:>18}: {queue_stats['high_water']} (dropped {queue_stats['dropped']}, coalesced {queue_stats['coalesced']}, superseded {queue_stats['superseded']})")
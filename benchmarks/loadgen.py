@@ -0,0 +1,192 @@
+"""
+Synthesises game traffic and pushes it through the primary pipeline (see benchmarks/harness.py) in rate steps,
+reporting the throughput achieved, how long the pipeline took to catch up after each step, how many actions the
+bounded queues shed (see flow_control.QUEUE_LIMITS), CPU and RSS.
+
+Traffic mix:
+    CHAT       username~sigil~tag~level~message lines, including commands, @mods calls, noobs and automod triggers
+    YELL       every Stats.get_yell_type category
+    CUSTOM     interactor, MODMOD and lb_tcg plugin frames
+    SET_ITEMS  large item dumps
+
+Usage: python -m benchmarks.loadgen [--db configs.db] [--rates 100,500,1000,0] [--duration 5] [--players 200]
+A rate of 0 pushes frames as fast as possible. CPU and RSS cover this whole process, stub game/API threads included.
+"""
+import argparse
+import os
+import random
+import resource
+import time
+
+from benchmarks.harness import PipelineHarness, print_report
+from repo import Repo
+
+DEFAULT_MIX = "chat=80,yell=5,custom=10,set_items=5"
+
+SIGILS = ["none", "sigil_ruby", "sigil_dragon", "sigil_tcg"]
+TAGS = ["none", "donor", "investor", "tcg"]
+
+CHAT_LINES = [
+    "hello everyone",
+    "anyone know where to farm bones?",
+    "gg",
+    "noob",
+    "lol that was close",
+    "luxbot fetch me the chat stats for today",
+    "!luxbot:pet",
+    "!luxbot:amy_noobs",
+    "@mods someone is spamming",
+]
+
+YELLS = [
+    "{player} found a diamond!",
+    "{player} found a legendary blood diamond!",
+    "{player} encountered a gem goblin!",
+    "{player} encountered a blood gem goblin!",
+    "{player} looted a monster sigil!",
+    "{player} has just reached level 100 in mining!",
+    "{player} has completed the elite achievements for fishing!",
+    "{player} is now wearing full gold armour!",
+    "{player} died to a spider and lost 1-Life Hardcore status!",
+    "{player} did something nobody has a category for.",
+]
+
+CUSTOMS = [
+    "{player}~IPP0:interactor:amy_noobs:*",
+    "{player}~IPP0:interactor:pet_title:bear",
+    "{player}~IPP0:interactor:help:none",
+    "{player}~IPP0:MODMOD:HELLO:1:0",
+    "{player}~IPP0:MODMOD:MODCHAT:anyone around?",
+    "{player}~IPP0:lb_tcg:offer:{other};{card}",
+    "{player}~PLAYER_OFFLINE",
+]
+
+
+class TrafficGenerator:
+    def __init__(self, players: int, mix: dict, flag_words: list, set_items_keys: int, seed: int = 1):
+        self.random = random.Random(seed)
+        self.players = [f"player{index}" for index in range(players)]
+        self.kinds = list(mix)
+        self.weights = list(mix.values())
+        self.chat_lines = CHAT_LINES + [f"you {word}" for word in flag_words[:1]]
+        self.set_items_keys = [f"item_{index}" for index in range(set_items_keys)]
+
+    def frame(self) -> str:
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        player = self.random.choice(self.players)
+
+        match kind:
+            case "chat":
+                sigil = self.random.choice(SIGILS)
+                tag = self.random.choice(TAGS)
+                level = self.random.randint(3, 2500)
+                return f"CHAT={player}~{sigil}~{tag}~{level}~{self.random.choice(self.chat_lines)}"
+            case "yell":
+                return f"YELL={self.random.choice(YELLS).format(player=player)}"
+            case "custom":
+                custom = self.random.choice(CUSTOMS)
+                other = self.random.choice(self.players)
+                return f"CUSTOM={custom.format(player=player, other=other, card=self.random.randint(1, 100000))}"
+            case "set_items":
+                return "SET_ITEMS=" + "~".join(f"{key}~{self.random.randint(0, 10_000_000)}" for key in self.set_items_keys)
+
+        raise ValueError(f"Unknown traffic kind: {kind}")
+
+
+def parse_mix(mix_string: str) -> dict:
+    mix = {}
+    for part in mix_string.split(","):
+        kind, weight = part.split("=")
+        mix[kind.strip()] = float(weight)
+
+    return mix
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def dropped_actions(harness: PipelineHarness) -> int:
+    return sum(queue_stats["dropped"] for queue_stats in harness.router.queue_stats().values())
+
+
+def run_step(harness: PipelineHarness, generator: TrafficGenerator, rate: float, duration: float) -> dict:
+    """Offers ``rate`` frames/s for ``duration`` seconds, then waits for the pipeline to drain."""
+    frames = 0
+    dropped_start = dropped_actions(harness)
+    cpu_start = cpu_seconds()
+    start = time.monotonic()
+    end = start + duration
+
+    while (now := time.monotonic()) < end:
+        if rate:
+            due = start + frames / rate
+            if due > now:
+                time.sleep(due - now)
+                continue
+
+        harness.inject(generator.frame())
+        frames += 1
+
+    injected = time.monotonic()
+    harness.wait_idle(timeout=300)
+    drained = time.monotonic()
+
+    return {
+        "offered": rate,
+        "frames": frames,
+        "throughput": frames / (drained - start),
+        "drain_s": drained - injected,
+        "dropped": dropped_actions(harness) - dropped_start,
+        "cpu_pct": (cpu_seconds() - cpu_start) / (drained - start) * 100,
+        "rss_mb": current_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="configs.db")
+    parser.add_argument("--rates", default="100,500,1000,0", help="Comma separated frames/s for each step, 0 is unthrottled")
+    parser.add_argument("--duration", type=float, default=5, help="Seconds per step")
+    parser.add_argument("--players", type=int, default=200)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--set-items-keys", type=int, default=400)
+    parser.add_argument("--verbose", action="store_true", help="Print the full pipeline report at the end")
+    args = parser.parse_args()
+
+    harness = PipelineHarness(args.db)
+    flag_words = Repo().read_config_row({"key": "automod_flag_words"}).get("word_list", "").split(",")
+    generator = TrafficGenerator(args.players, parse_mix(args.mix), flag_words, args.set_items_keys)
+
+    harness.start()
+
+    total_frames = 0
+    total_start = time.monotonic()
+
+    print(f"{'offered/s':>10} | {'frames':>8} | {'achieved/s':>10} | {'drain s':>8} | {'dropped':>8} | {'cpu %':>6} | {'rss MB':>7}")
+    for rate in (float(rate) for rate in args.rates.split(",")):
+        step = run_step(harness, generator, rate, args.duration)
+        total_frames += step["frames"]
+        offered = f"{step['offered']:.0f}" if step["offered"] else "max"
+        print(f"{offered:>10} | {step['frames']:>8} | {step['throughput']:>10.0f} | {step['drain_s']:>8.3f} | {step['dropped']:>8} | {step['cpu_pct']:>6.1f} | {step['rss_mb']:>7.1f}")
+
+    print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+    if args.verbose:
+        print_report(harness.report(), total_frames, time.monotonic() - total_start)
+
+    harness.close()
+    os._exit(0)  # Worker and stub threads are blocked on their queues
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Replays frames recorded by the Game process (run it with LUXBOT_RECORD=<file>) through the primary pipeline,
+against a stub game socket and stub API process, and reports throughput and reply latency.
+
+Usage: python -m benchmarks.replay <recording.jsonl> [--db configs.db] [--speed 1|10|0]
+A speed of 0 replays as fast as possible.
+
+The recording can also be the Game processes' frame archive directory (see archive.py), whose received frames are
+replayed, optionally only those between --since and --until.
+"""
+import argparse
+import json
+import os
+import time
+
+import archive
+
+from benchmarks.harness import PipelineHarness, print_report
+
+
+def load_recording(path: str) -> list[tuple[int, str, str]]:
+    frames = []
+    with open(path) as recording:
+        for line in recording:
+            if line.strip():
+                recorded = json.loads(line)
+                frames.append((recorded["time"], recorded["frame"], recorded.get("connection", "main")))
+
+    return frames
+
+
+def load_archive(directory: str, start: int = None, end: int = None) -> list[tuple[int, str, str]]:
+    frames = [
+        (frame_time, frame, connection_id)
+        for frame_time, connection_id, _, frame in archive.read_frames(directory, start, end, direction="in")
+    ]
+    frames.sort(key=lambda frame: frame[0])  # Segments of different connections overlap
+
+    return frames
+
+
+def replay(harness: PipelineHarness, frames: list[tuple[int, str, str]], speed: float) -> float:
+    """Injects ``frames`` at ``speed`` times their recorded pace. Returns the time taken to inject and drain them."""
+    first_recorded = frames[0][0]
+    start = time.monotonic()
+
+    for recorded_time, frame, connection_id in frames:
+        if speed:
+            due = start + (recorded_time - first_recorded) / 1e9 / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        harness.inject(frame, connection_id)
+
+    harness.wait_idle()
+
+    return time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording")
+    parser.add_argument("--db", default="configs.db")
+    parser.add_argument("--speed", type=float, default=0)
+    parser.add_argument("--since", type=archive.parse_time, help="Archive only. ISO date or datetime, local time")
+    parser.add_argument("--until", type=archive.parse_time, help="Archive only. ISO date or datetime, local time")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.recording):
+        frames = load_archive(args.recording, args.since, args.until)
+    else:
+        frames = load_recording(args.recording)
+    if not frames:
+        print("Recording is empty.")
+        return
+
+    harness = PipelineHarness(args.db)
+    harness.start()
+
+    elapsed = replay(harness, frames, args.speed)
+
+    print_report(harness.report(), len(frames), elapsed)
+    harness.close()
+    os._exit(0)  # Worker and stub threads are blocked on their queues
+
+
+if __name__ == '__main__':
+    main()
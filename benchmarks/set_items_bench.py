@@ -0,0 +1,100 @@
+"""
+Compares the old SET_ITEMS handling (split, convert every value, then diff the dict against the stored state) with
+GameState.update_frame (single pass, only converting values whose raw string changed), on a sequence of payloads.
+
+Payloads come from a recording (LUXBOT_RECORD) or frame archive directory if given, otherwise a generated sequence:
+a login sized dump, then smaller dumps where a few values change each time.
+
+Usage: python -m benchmarks.set_items_bench [recording.jsonl | archive dir] [--rounds 200]
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+import archive
+
+from game_state import GameState, parse_value
+
+
+def old_update(state: dict, payload: str) -> dict:
+    """SET_ITEMS handling before update_frame."""
+    split_vars = payload.split("~")
+    parsed_vars = {}
+    for i in range(0, len(split_vars), 2):
+        parsed_vars[split_vars[i]] = parse_value(split_vars[i+1])
+
+    changed = {key: value for key, value in parsed_vars.items() if state.get(key, None) != value}
+    state.update(changed)
+
+    return changed
+
+
+def load_payloads(path: str) -> list[str]:
+    if os.path.isdir(path):
+        frames = [frame for _, _, _, frame in archive.read_frames(path, types={"SET_ITEMS"}, direction="in")]
+    else:
+        with open(path) as recording:
+            frames = [json.loads(line)["frame"] for line in recording if line.strip()]
+
+    return [frame.split("=", 1)[1] for frame in frames if frame.startswith("SET_ITEMS=")]
+
+
+def generate_payloads(seed: int = 1) -> list[str]:
+    rng = random.Random(seed)
+    values = {f"var_{i}": str(rng.randint(-1000, 10_000_000)) for i in range(3000)}
+    for i in range(0, 3000, 10):
+        values[f"var_{i}"] = f"name_{i}"
+    keys = list(values)
+
+    payloads = ["~".join(f"{key}~{value}" for key, value in values.items())]
+    for _ in range(50):
+        for key in rng.sample(keys[:400], 5):
+            values[key] = str(rng.randint(0, 10_000_000))
+        payloads.append("~".join(f"{key}~{values[key]}" for key in keys[:400]))
+
+    return payloads
+
+
+def time_sequence(update, new_state, payloads: list[str], rounds: int) -> float:
+    """Microseconds per payload, each round applying the whole sequence to a fresh state."""
+    elapsed = 0
+    for _ in range(rounds):
+        state = new_state()
+        start = time.perf_counter()
+        for payload in payloads:
+            update(state, payload)
+        elapsed += time.perf_counter() - start
+
+    return elapsed / rounds / len(payloads) * 1000000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("payloads", nargs="?")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.payloads) if args.payloads else generate_payloads()
+    if not payloads:
+        print("No SET_ITEMS frames found.")
+        return
+
+    # Both must agree on what changed before their timings mean anything
+    old_state, new_state = {}, GameState()
+    for payload in payloads:
+        assert old_update(old_state, payload) == new_state.update_frame(payload)
+
+    keys = sum(payload.count("~") // 2 + 1 for payload in payloads)
+    old_time = time_sequence(old_update, dict, payloads, args.rounds)
+    new_time = time_sequence(GameState.update_frame, GameState, payloads, args.rounds)
+
+    print(f"{len(payloads)} payloads, {keys / len(payloads):.0f} keys each on average, "
+          f"{new_state.counters['keys_changed'] / keys:.1%} of keys changed")
+    print(f"    split + parse + diff: {old_time:8.2f} us per payload")
+    print(f"    update_frame:         {new_time:8.2f} us per payload ({old_time / new_time:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Measures the bot's cold-start budget.
+
+Import time of each process' entry module is measured in a fresh interpreter, along with the imports deferred until
+first use (login, webhooks). With --live, the bot itself is launched (needs the usual environment variables and a
+network connection) and the launch to VALID_LOGIN time the Game process records is read back from its metrics.
+
+Usage: python -m benchmarks.startup [--repeat 5] [--live] [--timeout 120]
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+from repo import Repo
+
+PROCESSES = {
+    "primary": ["main"],
+    "game": ["idle_pixel_bot"],
+    "api": ["apis"],
+    "webapp": ["webapp.webapp"],
+}
+
+DEFERRED = {
+    "game login": ["requests"],
+    "first webhook": ["aiohttp", "discord"],
+}
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_imports(modules: list[str]) -> float:
+    """Imports ``modules`` in a fresh interpreter, returning the time taken in milliseconds."""
+    code = (
+        "import time\n"
+        "start = time.perf_counter()\n"
+        + "".join(f"import {module}\n" for module in modules)
+        + "print((time.perf_counter() - start) * 1000)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def report_imports(title: str, groups: dict, repeat: int):
+    print(title)
+    for name, modules in groups.items():
+        timings = [time_imports(modules) for _ in range(repeat)]
+        print(f"    {name:>14}: median {statistics.median(timings):8.1f} ms | min {min(timings):8.1f} ms ({', '.join(modules)})")
+
+
+def run_live(timeout: float):
+    """Launches main.py and waits for the Game process to report its launch to VALID_LOGIN time."""
+    db = Repo()
+    # Own session, so the bot's child processes can be stopped along with it.
+    bot = subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, start_new_session=True)
+    deadline = time.monotonic() + timeout
+
+    try:
+        while time.monotonic() < deadline:
+            time.sleep(1)
+            game_metrics = [snapshot for process, snapshot in db.read_metrics().items() if process.startswith("game:")]
+            gauges = game_metrics[0].get("gauges", {}) if game_metrics else {}
+            if "startup.launch_to_valid_login_ms" in gauges and gauges.get("startup.import_ms") is not None:
+                print("Live start:")
+                print(f"    game import:            {gauges['startup.import_ms']:8.1f} ms")
+                print(f"    launch to VALID_LOGIN:  {gauges['startup.launch_to_valid_login_ms']:8.1f} ms")
+                print(f"    spawn to VALID_LOGIN:   {gauges['startup.spawn_to_valid_login_ms']:8.1f} ms")
+                return
+
+        print(f"No VALID_LOGIN within {timeout}s")
+    finally:
+        os.killpg(bot.pid, signal.SIGTERM)
+        bot.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--live", action="store_true")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    report_imports("Import time per process:", PROCESSES, args.repeat)
+    report_imports("Deferred until first use:", DEFERRED, args.repeat)
+
+    if args.live:
+        run_live(args.timeout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Compares the primary bus transports: ``Manager().Queue()`` proxies vs ``transport.ActionQueue``.
+
+A producer process puts chat-sized actions stamped with ``time.monotonic_ns()``, the consumer in this process reads them.
+Throughput is measured with a ``--count`` burst, hop latency with ``--paced`` actions sent ``--gap-us`` apart so the
+percentiles show the cost of a hop rather than the backlog of a saturated queue.
+
+Usage: python -m benchmarks.transport_bench [--count 20000] [--paced 2000] [--gap-us 500]
+"""
+import argparse
+import statistics
+import time
+
+from multiprocessing import Manager, Process
+
+from transport import ActionQueue
+
+
+STOP_ACTION = {
+    "target": "main",
+    "action": "main_close",
+    "payload": "",
+    "source": "main",
+}
+
+
+def sample_action(sent_ns: int) -> dict:
+    return {
+        "target": "ws_handlers",
+        "action": "dispatch",
+        "payload": {
+            "type": "CHAT",
+            "payload": "luxferre~0~none~2412~!luxbot:pet bear",
+            "time": time.time_ns(),
+            "sent_ns": sent_ns,
+        },
+        "source": "game",
+    }
+
+
+def produce(out_queue, count: int, gap: float):
+    for _ in range(count):
+        out_queue.put(sample_action(time.monotonic_ns()))
+        if gap:
+            time.sleep(gap)
+
+    out_queue.put(STOP_ACTION)
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    index = min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def drain(bench_queue, count: int, gap: float) -> tuple[float, list]:
+    producer = Process(target=produce, args=(bench_queue, count, gap))
+
+    latencies = []
+    start = time.perf_counter()
+    producer.start()
+
+    while True:
+        action = bench_queue.get()
+        if action["action"] == "main_close":
+            break
+        latencies.append(time.monotonic_ns() - action["payload"]["sent_ns"])
+
+    elapsed = time.perf_counter() - start
+    producer.join()
+
+    return elapsed, latencies
+
+
+def run_case(name: str, bench_queue, count: int, paced: int, gap_us: int) -> dict:
+    elapsed, _ = drain(bench_queue, count, 0)
+    _, latencies = drain(bench_queue, paced, gap_us / 1000000)
+
+    latencies.sort()
+
+    return {
+        "transport": name,
+        "actions_per_sec": round(count / elapsed),
+        "p50_us": round(statistics.median(latencies) / 1000, 1),
+        "p99_us": round(percentile(latencies, 99) / 1000, 1),
+        "max_us": round(latencies[-1] / 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--paced", type=int, default=2000)
+    parser.add_argument("--gap-us", type=int, default=500)
+    args = parser.parse_args()
+
+    manager = Manager()
+
+    results = [
+        run_case("Manager().Queue", manager.Queue(), args.count, args.paced, args.gap_us),
+        run_case("ActionQueue", ActionQueue(), args.count, args.paced, args.gap_us),
+    ]
+
+    manager.shutdown()
+
+    for result in results:
+        print(
+            f"{result['transport']:>16}: {result['actions_per_sec']:>8} actions/s | "
+            f"p50 {result['p50_us']:>9} us | p99 {result['p99_us']:>9} us | max {result['max_us']:>9} us"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,11 @@
 from multiprocessing.queues import Queue
 from datetime import datetime, timedelta
 
+import tracing
+
 from repo import Repo
 from utils import Utils
+from metrics import instrumented
 
 
 class Chat:
@@ -118,6 +121,7 @@ class Chat:
 
         return message_data
 
+    @instrumented
     def handle(self, action: dict):
         if action["action"] == "send":
             self.send(action)
@@ -128,6 +132,7 @@ class Chat:
         parsed_message = self.parse_chat(message["payload"])
 
         parsed_message["time"] = message["time"]
+        parsed_message["raw"] = message["payload"]
 
         has_slur, detected_slur = self.has_slur(parsed_message["message"])
         parsed_message["has_slur"] = has_slur
@@ -137,41 +142,7 @@ class Chat:
             if parsed_message["message"][:8].lower() == "!luxbot:":
                 self.handle_luxbot_command(parsed_message)
 
-        actions = [
-            {
-                "target": "stats",
-                "action": "handle_chat",
-                "payload": parsed_message,
-                "source": "chat",
-            },
-            {
-                "target": "integration",
-                "action": "log_chat_history",
-                "payload": message,
-                "source": "chat",
-            },
-            {
-                "target": "mod",
-                "action": "handle_at_mods",
-                "payload": parsed_message,
-                "source": "chat",
-            },
-            {
-                "target": "mod",
-                "action": "handle_automod",
-                "payload": parsed_message,
-                "source": "chat",
-            },
-            {
-                "target": "integration",
-                "action": "mirror_chat_to_discord",
-                "payload": parsed_message,
-                "source": "chat",
-            },
-        ]
-
-        for action in actions:
-            self.p_q.put(action)
+        self.p_q.put(Utils.gen_publish_action("chat", parsed_message, "chat"))
 
     def send(self, action: dict):
         message = f"CHAT={action['payload']['payload']}"
@@ -241,6 +212,8 @@ class Chat:
             print(f"{message['player']['username']}[{message['player']['perm_level']}] attempted command {parsed_command['command']}[{req_perm}]!")
             return
 
+        tracing.set_command(f"chat.{parsed_command['command']}")
+
         if parsed_command["command"] == "help":
             self.handle_help_command(message)
         else:
@@ -0,0 +1,38 @@
+import os
+
+DEFAULT_SERVER = "wss://server1.idle-pixel.com"
+
+
+def load_connections() -> dict:
+    """
+    Returns the game connections to run, from LUXBOT_CONNECTIONS: a comma separated list of ``id`` or ``id@server``,
+    eg "main,tcg@wss://server2.idle-pixel.com". Defaults to a single "main" connection to DEFAULT_SERVER.
+
+    Each connection is its own Game process with its own account. The first logs in with IP_USERNAME/IP_PASSWORD
+    and handles the traffic every account receives (chat, yells, events). The rest log in with
+    IP_USERNAME_<ID>/IP_PASSWORD_<ID> and only pass on what is addressed to their own account (see
+    ingress.SHARED_FRAME_FILTERS).
+
+    :return: {connection id: {"server": url, "username_var": env var, "password_var": env var, "primary": bool}}
+    :rtype: dict
+    """
+    connections = {}
+
+    for spec in os.environ.get("LUXBOT_CONNECTIONS", "main").split(","):
+        connection_id, _, server = spec.strip().partition("@")
+        primary = not connections
+        suffix = "" if primary else f"_{connection_id.upper()}"
+
+        connections[connection_id] = {
+            "server": server or DEFAULT_SERVER,
+            "username_var": f"IP_USERNAME{suffix}",
+            "password_var": f"IP_PASSWORD{suffix}",
+            "primary": primary,
+        }
+
+    return connections
+
+
+def connection_target(connection_id: str) -> str:
+    """Router target of a connection's Game process, eg "game:main"."""
+    return f"game:{connection_id}"
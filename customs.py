@@ -2,8 +2,11 @@ import re
 
 from multiprocessing.queues import Queue
 
+import tracing
+
 from repo import Repo
 from utils import Utils
+from metrics import instrumented
 
 
 class Customs:
@@ -81,6 +84,12 @@ class Customs:
                 "permission": 3,
                 "help_string": "Adds a new datapoint to the chat_stats stored in the database. [addstat:<datapoint_name>]",
             },
+            "ingress": {
+                "target_module": "admin",
+                "target_command": "set_ingress_filter",
+                "permission": 3,
+                "help_string": "Sets how the game process filters a frame type. [ingress:<frame type>;<forward/drop/sample:N/aggregate:S>]",
+            },
             "generic": {
                 "target_module": "admin",
                 "target_command": "generic_ws",
@@ -91,7 +100,7 @@ class Customs:
                 "target_module": "admin",
                 "target_command": "close_connection",
                 "permission": 3,
-                "help_string": "Closes websocket connection. [close:close/restart]",
+                "help_string": "Closes or restarts game connections, all unless one is named. [close:close/restart;<connection>]",
             },
             "echo": {
                 "target_module": None,
@@ -182,6 +191,7 @@ class Customs:
 
         return custom_data
 
+    @instrumented
     def handle(self, action: dict):
         if action["action"] == "send":
             self.send(action)
@@ -264,6 +274,8 @@ class Customs:
             print(f"{message['player']['username']}[{player_perm}] attempted custom {message['command']}[{req_perm}]!")
             return
 
+        tracing.set_command(f"custom.{message['command']}")
+
         match message["command"]:
             case "echo":
                 self.echo(message)
@@ -289,17 +301,19 @@ class Customs:
         paginated_payload = re.findall(".{1," + f"{payload_max_length}" + "}", payload)
 
         if player and command:
+            actions = []
             for page in paginated_payload:
                 custom_message = f"{leading_data}:{page}"
 
-                action = {
+                actions.append({
                     "target": "game",
                     "action": "send_ws_message",
                     "payload": custom_message,
                     "source": "custom",
-                }
+                })
 
-                self.p_q.put(action)
+            if actions:
+                self.p_q.put(Utils.gen_batch_action(actions, "custom"))
         else:
             print("Invalid custom send:")
             print(custom_data)
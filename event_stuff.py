@@ -3,6 +3,7 @@ from datetime import datetime, timedelta, timezone
 
 from repo import Repo
 from utils import Utils
+from metrics import instrumented
 
 
 class Event:
@@ -17,6 +18,11 @@ class Event:
                 "target": self.handle_set_items
             },
         }
+        # Topic: [dispatch map keys] or {dispatch map key: [payload key patterns]}, see Router
+        self.subscriptions = {
+            "set_items": {"handle_set_items": ["event_*"]},
+            "event_global_progress": ["handle_event_progress"],
+        }
         self.raw_event_scores = ""
         self.parsed_event_score = {}
         self.event_countdown_started = False
@@ -24,6 +30,7 @@ class Event:
         self.current_event_type = ""
         self.current_event_running_timer = 0
 
+    @instrumented
     def dispatch(self, action: dict):
         target_dict = self.dispatch_map.get(action["action"], None)
 
@@ -38,17 +45,18 @@ class Event:
         self.raw_event_scores = message
 
     def handle_set_items(self, action: dict):
-        parsed_items = action["payload"]
+        # Only changed event_* items are delivered, so a missing item is unchanged rather than unset.
+        changed_items = action["payload"]
 
-        new_data = {
-            "current_event_start_timer": parsed_items.get("event_upcomming_timer", None),
-            "current_event_type": parsed_items.get("event_name", None),
-            "current_event_running_timer": parsed_items.get("event_active_timer", 1),
+        item_attributes = {
+            "event_upcomming_timer": "current_event_start_timer",
+            "event_name": "current_event_type",
+            "event_active_timer": "current_event_running_timer",
         }
 
-        for key, value in new_data.items():
-            if value:
-                setattr(self, key, value)
+        for item, attribute in item_attributes.items():
+            if item in changed_items:
+                setattr(self, attribute, changed_items[item])
 
         self.update_event_status()
 
@@ -62,6 +70,8 @@ class Event:
 
     def start_event_countdown(self):
         self.event_countdown_started = True
+        # The last event's negative running timer is only replaced once the item changes, don't let it end this one.
+        self.current_event_running_timer = max(self.current_event_running_timer, 1)
         start_timer = self.current_event_start_timer
         event_type = self.current_event_type
 
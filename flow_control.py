@@ -0,0 +1,316 @@
+import time
+
+from collections import deque
+from multiprocessing.queues import Queue
+
+MODERATION = 0
+COMMAND = 1
+BULK = 2
+
+LANE_NAMES = ("moderation", "command", "bulk")
+
+# Action key (see action_key) or bare target -> lane. Anything not listed is bulk traffic, ie stats and mirroring.
+LANE_RULES = {
+    "main": MODERATION,
+    "mod": MODERATION,
+    "chat": COMMAND,
+    "custom": COMMAND,
+    "fun": COMMAND,
+    "admin": COMMAND,
+    "game.send_ws_message": COMMAND,
+    "game.set_ws_active": COMMAND,
+    "publish.chat": COMMAND,
+    "api.paste": COMMAND,
+    "ws_handlers.CHAT": COMMAND,
+    "ws_handlers.CUSTOM": COMMAND,
+    "ws_handlers.OPEN_DIALOGUE": COMMAND,
+    "ws_handlers.VALID_LOGIN": COMMAND,
+}
+
+
+# Bounds, in actions. "primary" is per PriorityInbox lane, remote targets are their Outbox.
+# "pending" is how much may wait in the primary process, "in_flight" how much may sit in the remote process' queue.
+# None is unbounded.
+QUEUE_LIMITS = {
+    "primary": {
+        "moderation": None,
+        "command": 2000,
+        "bulk": 5000,
+    },
+    "game": {
+        "pending": 1000,
+        "in_flight": 50,
+    },
+    "api": {
+        "pending": 200,
+        "in_flight": 10,
+    },
+}
+
+# Action key (see action_key) -> what to do with an action when it's queued.
+#   "drop": (default) queued if there's room, dropped if the queue is full.
+#   "latest": replaces any older action with the same key still waiting, only the newest is worth routing.
+#   "coalesce": merged into the previous waiting action if that has the same key, see coalesce_payloads.
+#   "keep": always queued, even past the bound. Moderation lane actions are always "keep".
+QUEUE_POLICIES = {
+    "ws_handlers.UPDATE_TIMER": "latest",
+    "ws_handlers.EVENT_GLOBAL_PROGRESS": "latest",
+    "api.chat_mirror_webhook": "coalesce",
+}
+
+DISCORD_MESSAGE_LIMIT = 2000
+# Seconds between reports of a full queue dropping actions. Drops in between are only counted, an overloaded process
+# printing a line per dropped action only adds to its load.
+DROP_REPORT_INTERVAL = 10
+
+
+def action_key(action: dict) -> str:
+    """
+    Key used to look an action up in the flow control tables: "target.action",
+    or "ws_handlers.FRAME_TYPE" for inbound websocket frames.
+    """
+    if action["target"] == "ws_handlers":
+        return f"ws_handlers.{action['payload']['type']}"
+
+    return f"{action['target']}.{action['action']}"
+
+
+def classify(action: dict) -> int:
+    """Returns the lane an action belongs in."""
+    target = action["target"]
+
+    if target == "batch":
+        return min(classify(batched_action) for batched_action in action["payload"])
+
+    if target == "game" and action["action"] == "send_ws_message" and action["payload"][:5] == "MUTE=":
+        return MODERATION
+
+    if target == "publish" and action["action"] == "chat" and action["payload"]["has_slur"]:
+        return MODERATION
+
+    lane = LANE_RULES.get(action_key(action), None)
+
+    if lane is None:
+        lane = LANE_RULES.get(target, BULK)
+
+    return lane
+
+
+def get_policy(action: dict, key: str) -> str:
+    if classify(action) == MODERATION:
+        return "keep"
+
+    return QUEUE_POLICIES.get(key, "drop")
+
+
+def coalesce_payloads(waiting: dict, action: dict) -> dict | None:
+    """
+    Returns a single action carrying both payloads, or None if they can't be merged.
+    Payloads are joined line by line, up to the length of a Discord message.
+    """
+    merged_payload = f"{waiting['payload']}\n{action['payload']}"
+
+    if len(merged_payload) > DISCORD_MESSAGE_LIMIT:
+        return None
+
+    merged_action = dict(waiting)
+    merged_action["payload"] = merged_payload
+    # The newest trace, so reply latency covers the frame that waited least rather than vanishing with it
+    if "trace" in action:
+        merged_action["trace"] = action["trace"]
+
+    return merged_action
+
+
+class BoundedLane:
+    """
+    FIFO of actions with a length bound and per action policies, see QUEUE_POLICIES.
+    Records how many actions were dropped, superseded or coalesced, and its high-water mark.
+    """
+    def __init__(self, limit: int | None):
+        # Entries are single item lists, so "latest" and "coalesce" can replace an action in place.
+        self.entries = deque()
+        self.latest = {}
+        self.limit = limit
+        self.length = 0
+        self.last_drop_report = (None, 0)
+        self.counters = {
+            "queued": 0,
+            "dropped": 0,
+            "superseded": 0,
+            "coalesced": 0,
+            "high_water": 0,
+        }
+
+    def __len__(self) -> int:
+        return self.length
+
+    def push(self, action: dict) -> bool:
+        """Queues ``action`` according to its policy. Returns False if it was dropped."""
+        key = action_key(action)
+        policy = get_policy(action, key)
+
+        if policy == "latest":
+            stale_entry = self.latest.pop(key, None)
+            if stale_entry is not None:
+                stale_entry[0] = None
+                self.length -= 1
+                self.counters["superseded"] += 1
+        elif policy == "coalesce" and self.entries:
+            last_entry = self.entries[-1]
+            if last_entry[0] is not None and action_key(last_entry[0]) == key:
+                merged_action = coalesce_payloads(last_entry[0], action)
+                if merged_action is not None:
+                    last_entry[0] = merged_action
+                    self.counters["coalesced"] += 1
+                    return True
+
+        if policy != "keep" and self.limit is not None and self.length >= self.limit:
+            self.counters["dropped"] += 1
+            return False
+
+        entry = [action]
+        self.entries.append(entry)
+
+        if policy == "latest":
+            self.latest[key] = entry
+
+        self.length += 1
+        self.counters["queued"] += 1
+        self.counters["high_water"] = max(self.counters["high_water"], self.length)
+
+        return True
+
+    def report_drop(self, name: str, key: str):
+        """Prints that ``name`` is full and dropping actions, at most once every DROP_REPORT_INTERVAL seconds."""
+        now = time.monotonic()
+        reported_at, reported_drops = self.last_drop_report
+
+        if reported_at is not None and now - reported_at < DROP_REPORT_INTERVAL:
+            return
+
+        dropped = self.counters["dropped"] - reported_drops
+        print(f"{name} full, {dropped} action(s) dropped since the last report, latest: {key}")
+        self.last_drop_report = (now, self.counters["dropped"])
+
+    def popleft(self) -> dict:
+        """Returns the oldest waiting action. Raises IndexError if there isn't one."""
+        while True:
+            entry = self.entries.popleft()
+            action = entry[0]
+            if action is None:
+                continue
+
+            key = action_key(action)
+            if self.latest.get(key, None) is entry:
+                del self.latest[key]
+
+            self.length -= 1
+
+            return action
+
+
+class Outbox:
+    """
+    Flow control for actions headed to another process.
+
+    At most ``in_flight`` actions are left sitting in the remote process' queue at once. The rest wait here in a
+    BoundedLane, where they can still be coalesced, superseded or dropped instead of piling up in the pipe
+    while the remote process is stalled (eg the API process waiting on Discord).
+    """
+    def __init__(self, name: str, remote_queue: Queue):
+        """
+        :param name: Target of the remote process, eg "api". Game connections ("game:<id>") share the "game" limits.
+        """
+        limits = QUEUE_LIMITS.get(name.split(":", 1)[0], {})
+
+        self.name = name
+        self.remote_queue = remote_queue
+        self.in_flight = limits.get("in_flight", None)
+        self.pending = BoundedLane(limits.get("pending", None))
+        self.in_flight_high_water = 0
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def put(self, action: dict):
+        if not self.pending.push(action):
+            self.pending.report_drop(f"{self.name} outbox", action_key(action))
+
+        self.flush()
+
+    def flush(self):
+        """Moves waiting actions to the remote queue while it's under its in-flight bound."""
+        if not self.pending:
+            return
+
+        depth = self.remote_queue.qsize()
+
+        while self.pending and (self.in_flight is None or depth < self.in_flight):
+            self.remote_queue.put(self.pending.popleft())
+            depth += 1
+
+        self.in_flight_high_water = max(self.in_flight_high_water, depth)
+
+    def stats(self) -> dict:
+        queue_stats = dict(self.pending.counters)
+        queue_stats["pending"] = len(self.pending)
+        queue_stats["in_flight"] = self.remote_queue.qsize()
+        queue_stats["in_flight_high_water"] = self.in_flight_high_water
+
+        return queue_stats
+
+
+class PriorityInbox:
+    """
+    Orders actions waiting to be routed by lane: moderation, then command replies, then bulk (stats, mirroring etc.)
+    Each lane is a BoundedLane, FIFO with the bounds and policies in QUEUE_LIMITS["primary"] and QUEUE_POLICIES.
+
+    A waiting lane which has been passed over ``max_skips`` times in a row is served next regardless of priority,
+    so a flood of higher priority traffic can delay bulk traffic but never starve it.
+    """
+    def __init__(self, max_skips: int = 16):
+        limits = QUEUE_LIMITS["primary"]
+
+        self.lanes = [BoundedLane(limits.get(name, None)) for name in LANE_NAMES]
+        self.skipped = [0 for _ in LANE_NAMES]
+        self.max_skips = max_skips
+        self.length = 0
+
+    def __len__(self) -> int:
+        return self.length
+
+    def push(self, action: dict):
+        lane = self.lanes[classify(action)]
+
+        length_before = len(lane)
+        if not lane.push(action):
+            lane.report_drop("Primary inbox", action_key(action))
+
+        self.length += len(lane) - length_before
+
+    def pop(self) -> dict:
+        """Returns the next action to route. Raises IndexError if the inbox is empty."""
+        waiting = [index for index, lane in enumerate(self.lanes) if lane]
+
+        if not waiting:
+            raise IndexError("pop from an empty PriorityInbox")
+
+        chosen = waiting[0]
+
+        for index in reversed(waiting[1:]):
+            if self.skipped[index] >= self.max_skips:
+                chosen = index
+                break
+
+        for index in waiting:
+            if index != chosen:
+                self.skipped[index] += 1
+
+        self.skipped[chosen] = 0
+        self.length -= 1
+
+        return self.lanes[chosen].popleft()
+
+    def stats(self) -> dict:
+        return {name: dict(lane.counters, waiting=len(lane)) for name, lane in zip(LANE_NAMES, self.lanes)}
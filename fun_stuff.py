@@ -5,6 +5,7 @@ from datetime import datetime
 
 from repo import Repo
 from utils import Utils
+from metrics import instrumented
 
 
 class Fun:
@@ -43,7 +44,12 @@ class Fun:
                 "target": self.handle_yell
             },
         }
+        # Topic: [dispatch map keys], see Router
+        self.subscriptions = {
+            "yell": ["handle_yell"],
+        }
 
+    @instrumented
     def dispatch(self, action: dict):
         target_dict = self.dispatch_map.get(action["action"], None)
 
@@ -0,0 +1,98 @@
+import fnmatch
+import re
+
+
+def parse_value(value: str) -> int | str:
+    """SET_ITEMS values are integers where they look like one, otherwise strings."""
+    if value.isnumeric():
+        return int(value)
+
+    if value[:1] == "-" and value[1:].isnumeric():
+        return -int(value[1:])
+
+    return value
+
+
+class GameState:
+    """
+    The game variables sent in SET_ITEMS frames, typed (see ``parse_value``).
+
+    ``update_frame`` returns only the variables a SET_ITEMS payload actually changed, so subscribers to the set_items
+    topic never see the hundreds of unchanged variables each frame repeats. The payload is read in a single pass
+    against the last raw string of each variable, so unchanged variables are skipped without ever being converted.
+    Counts how many updates and variables it has seen, and how many of each changed.
+
+    ``reset`` forgets every variable, so the next payload is returned in full. Called on each (re)login.
+    """
+    def __init__(self):
+        self.values = {}
+        self.raw_values = {}
+        self.counters = {
+            "updates": 0,
+            "unchanged_updates": 0,
+            "keys_received": 0,
+            "keys_changed": 0,
+            "resets": 0,
+        }
+
+    def __getitem__(self, key: str):
+        return self.values[key]
+
+    def get(self, key: str, default=None):
+        return self.values.get(key, default)
+
+    def reset(self):
+        """Forgets every variable, both typed and raw. The counters are kept."""
+        self.values.clear()
+        self.raw_values.clear()
+        self.counters["resets"] += 1
+
+    def update_frame(self, payload: str) -> dict:
+        """Stores the variables of a SET_ITEMS payload ("key~value~key~value..."), returning those which changed."""
+        raw_values = self.raw_values
+        changed = {}
+        split_payload = payload.split("~")
+        pairs = iter(split_payload)
+
+        for key, raw_value in zip(pairs, pairs):
+            if raw_values.get(key, None) != raw_value:
+                raw_values[key] = raw_value
+                changed[key] = parse_value(raw_value)
+
+        self.values.update(changed)
+        self.count(len(split_payload) // 2, len(changed))
+
+        return changed
+
+    def count(self, received: int, changed: int):
+        self.counters["updates"] += 1
+        self.counters["keys_received"] += received
+        self.counters["keys_changed"] += changed
+        if not changed:
+            self.counters["unchanged_updates"] += 1
+
+
+class KeyFilter:
+    """
+    Selects the items of a dict payload whose keys match any of a set of glob patterns, eg ["event_*"].
+    Used by the Router for subscriptions which only care about some game variables.
+    """
+    def __init__(self, patterns: list[str]):
+        self.patterns = patterns
+        self.regex = re.compile("|".join(fnmatch.translate(pattern) for pattern in patterns))
+        # Key -> matched. The set of game variable names is small and fixed, so every key is only matched once.
+        self.matches = {}
+
+    def select(self, payload: dict) -> dict:
+        matches = self.matches
+        selected = {}
+
+        for key, value in payload.items():
+            matched = matches.get(key, None)
+            if matched is None:
+                matched = matches[key] = self.regex.match(key) is not None
+
+            if matched:
+                selected[key] = value
+
+        return selected
@@ -1,27 +1,63 @@
 import os
+import re
+import json
+import time
 import queue
 import websocket
 import rel
 import ssl
 import traceback
-import requests
 
-from bs4 import BeautifulSoup
 from datetime import datetime
 from multiprocessing.queues import Queue
 
-from utils import RepeatTimer
+import tracing
+
+from metrics import instrumented, registry
+from outbound import SendScheduler, OutboundBuffer
+from ingress import IngressFilter, INGRESS_FILTERS, SHARED_FRAME_FILTERS
+from archive import FrameArchive
+from reconnect import ReconnectController, PING_INTERVAL
+from connections import load_connections, connection_target
+
+CSRF_INPUT = re.compile(r"<input[^>]*name=[\"']csrfmiddlewaretoken[\"'][^>]*>", re.IGNORECASE)
+INPUT_VALUE = re.compile(r"value=[\"']([^\"']*)[\"']")
+FIRST_SCRIPT = re.compile(r"<script[^>]*>(.*?)</script>", re.IGNORECASE | re.DOTALL)
+# Seconds after sending LOGIN without a VALID_LOGIN before the signature is given up on and the connection dropped.
+LOGIN_TIMEOUT = 30
 
 
 class Game:
-    def __init__(self, p_q: Queue, game_queue: Queue):
+    def __init__(self, p_q: Queue, game_queue: Queue, connection_id: str = "main", connection: dict = None):
+        """
+        :param connection_id: ID of this game connection, see connections.load_connections
+        :param connection: This connection's settings. Looked up from the environment if not given.
+        """
+        self.connection_id = connection_id
+        self.connection = connection if connection is not None else load_connections()[connection_id]
         self.development_mode = False
+        self.recording = None
         self.env_consts = {}
         self.game_ws = None
         self.p_q = p_q
         self.game_queue = game_queue
         self.game_vars = {}
         self.ws_active = False
+        self.startup_recorded = False
+        self.login_session = None
+        self.game_page_url = None
+        self.signature = None
+        self.login_sent = False
+        self.login_attempt = 0
+        self.reconnector = ReconnectController(self.connect)
+        self.archive = FrameArchive(connection_id)
+        self.send_scheduler = SendScheduler(self.write_ws_message)
+        buffer_dir = os.environ.get("LUXBOT_OUTBOUND_DIR", ".")
+        self.outbound_buffer = OutboundBuffer(os.path.join(buffer_dir, f"outbound_{connection_id}.json"))
+        ingress_filters = dict(INGRESS_FILTERS)
+        if not self.connection["primary"]:
+            ingress_filters.update(SHARED_FRAME_FILTERS)
+        self.ingress_filter = IngressFilter(self.forward_ws_message, ingress_filters)
 
         self.dispatch_map = {
             "set_items": {
@@ -36,6 +72,9 @@ class Game:
             "set_ws_active": {
                 "target": self.set_ws_active
             },
+            "set_ingress_filter": {
+                "target": self.set_ingress_filter
+            },
         }
 
     def get_env_var(self, env_var: str) -> str:
@@ -48,57 +87,128 @@ class Game:
 
     def get_env_consts(self) -> dict:
         """Return dict containing all required environment variables at application launch."""
-        env_const_dict = {
-            "IP_USERNAME": "",
-            "IP_PASSWORD": "",
+        # Const: environment variable, which differ per connection.
+        env_vars = {
+            "IP_USERNAME": self.connection["username_var"],
+            "IP_PASSWORD": self.connection["password_var"],
         }
 
-        for key in env_const_dict:
-            env_const_dict[key] = self.get_env_var(key)
+        env_const_dict = {}
+
+        for key, env_var in env_vars.items():
+            env_const_dict[key] = self.get_env_var(env_var)
 
         return env_const_dict
 
-    def check_queue(self):
-        try:
-            new_action = self.game_queue.get(False)
-            self.dispatch(new_action)
-        except queue.Empty:
-            pass
+    def drain_game_queue(self) -> bool:
+        """
+        Called by rel whenever the game queue's pipe is readable. Handles every action waiting, not just one.
+
+        :return: True, which keeps the read event registered with rel
+        :rtype: bool
+        """
+        while True:
+            try:
+                new_action = self.game_queue.get(False)
+            except queue.Empty:
+                break
+
+            try:
+                self.dispatch(new_action)
+            except Exception as e:
+                print(f"Game error handling {new_action['action']}: {e}")
+                traceback.print_tb(e.__traceback__)
+
+        return True
 
     def get_signature(self) -> str:
+        """
+        Returns the authentication signature for connecting to the websocket server.
+
+        The signature is cached, and only fetched again once the server has refused it or left it unanswered (see
+        ``on_connection_lost`` and ``check_login``), so most reconnects go straight back to sending LOGIN without
+        touching the webserver.
+
+        :return: Authentication signature
+        :rtype: str
+        """
+        if self.signature is None:
+            self.signature = self.fetch_signature()
+
+        return self.signature
+
+    def fetch_signature(self) -> str:
         """
         Uses requests to log into the webserver and retrieve the authentication signature for connecting to the websocket server.
 
+        The logged in session is kept, and while it lasts the signature is read straight off the game page without
+        sending the credentials again. A session which fails to log in is dropped, so the next attempt starts afresh.
+
         :return: Authentication signature
         :rtype: str
         """
-        with requests.session() as s:
-            home_page = s.get("https://idle-pixel.com/login")
-            home_soup = BeautifulSoup(home_page.text, 'html.parser')
-            csrf = home_soup.find(attrs={"name": "csrfmiddlewaretoken"})['value']
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
-                "Referrer-Policy": "same-origin",
-                "Referer": "https://idle-pixel.com/login/",
-            }
-            payload = {
-                "csrfmiddlewaretoken": csrf,
-                "server_selected": "",
-                "username": self.env_consts["IP_USERNAME"],
-                "password": self.env_consts["IP_PASSWORD"]
-            }
+        # Only needed to log in, so imported here to keep it out of the process' startup.
+        import requests
+
+        if self.login_session is not None and self.game_page_url is not None:
+            try:
+                game_page = self.login_session.get(self.game_page_url)
+                # An expired session is redirected away from the game page, back to the login page
+                if game_page.ok and game_page.url == self.game_page_url:
+                    return self.parse_signature(game_page.text)
+            except (requests.RequestException, ValueError) as e:
+                print(f"Couldn't reuse the login session: {e}")
+
+        self.login_session = requests.Session()
+
+        try:
+            return self.log_in(self.login_session)
+        except Exception:
+            self.drop_login_session()
+            raise
+
+    def log_in(self, s) -> str:
+        """Logs into the webserver with the account's credentials, returning the signature from the game page."""
+        home_page = s.get("https://idle-pixel.com/login")
+        csrf_input = CSRF_INPUT.search(home_page.text)
+        if csrf_input is None:
+            raise ValueError("No csrf token found on the login page.")
+
+        csrf = INPUT_VALUE.search(csrf_input.group(0)).group(1)
+        headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
+            "Referrer-Policy": "same-origin",
+            "Referer": "https://idle-pixel.com/login/",
+        }
+        payload = {
+            "csrfmiddlewaretoken": csrf,
+            "server_selected": "",
+            "username": self.env_consts["IP_USERNAME"],
+            "password": self.env_consts["IP_PASSWORD"]
+        }
+
+        login = s.post("https://idle-pixel.com/login/", data=payload, headers=headers)
 
-            login = s.post("https://idle-pixel.com/login/", data=payload, headers=headers)
+        signature = self.parse_signature(login.text)
+        self.game_page_url = login.url
 
-            game_soup = BeautifulSoup(login.text, 'html.parser')
+        return signature
 
-            script_tag = game_soup.find("script").text
+    @staticmethod
+    def parse_signature(game_page: str) -> str:
+        # The signature is the first quoted string in the game page's first script tag.
+        script_tag = FIRST_SCRIPT.search(game_page)
+        if script_tag is None:
+            raise ValueError("No script found on the game page, login failed.")
 
-            sig_plus_wrap = script_tag.split(";", 1)[0]
+        sig_plus_wrap = script_tag.group(1).split(";", 1)[0]
 
-            signature = sig_plus_wrap.split("'")[1]
+        return sig_plus_wrap.split("'")[1]
 
-            return signature
+    def drop_login_session(self):
+        self.signature = None
+        self.login_session = None
+        self.game_page_url = None
 
     def on_ws_message(self, ws, raw_message: str):
         """
@@ -111,17 +221,29 @@ class Game:
         if self.development_mode:
             self.log_ws_message(raw_message, True)
 
+        if self.recording:
+            self.record_ws_message(raw_message)
+
+        self.archive.append("in", raw_message)
+        self.ingress_filter.receive(raw_message)
+
+    def forward_ws_message(self, raw_message: str):
+        """Sends a received frame which made it through the IngressFilter on to the primary process."""
+        self.p_q.put(self.build_frame_action(raw_message, self.connection_id))
+
+    @staticmethod
+    def build_frame_action(raw_message: str, connection_id: str = None) -> dict:
+        """Wraps a received websocket frame in a traced ws_handlers action, tagged with the connection it came from."""
         split_message = raw_message.split("=", 1)
         payload = None
         if len(split_message) > 1:
             payload = split_message[1]
 
-        current_time = datetime.now()
-
         message_data = {
             "type": split_message[0],
             "payload": payload,
-            "time": current_time,
+            "time": time.time_ns(),
+            "connection": connection_id,
         }
 
         action = {
@@ -129,21 +251,27 @@ class Game:
             "action": "dispatch",
             "payload": message_data,
             "source": "game",
+            "trace": tracing.new_trace(connection_id),
         }
 
-        self.p_q.put(action)
+        return action
+
+    def record_ws_message(self, raw_message: str):
+        """Appends a received frame to the recording file, for replaying with benchmarks/replay.py."""
+        recorded = {"time": time.time_ns(), "frame": raw_message, "connection": self.connection_id}
+        self.recording.write(json.dumps(recorded) + "\n")
 
     def on_ws_error(self, ws, error):
         """
         Top level error handler.
 
-        If websocket connection drops, will print a retrying message to notify before ``rel`` retries.
+        If websocket connection drops, will print a retrying message to notify before reconnecting.
         Otherwise, prints timestamp, error, and traceback.
 
         :param ws: websocket
         :param error: Exception object
         """
-        self.ws_active = False
+        self.on_connection_lost()
 
         if isinstance(error, websocket.WebSocketConnectionClosedException):
             print("Connection closed. Retrying...")
@@ -153,8 +281,24 @@ class Game:
             traceback.print_tb(error.__traceback__)
 
     def on_ws_close(self, ws, close_status_code, close_msg):
-        """Called when websocket is closed by server."""
+        """Called whenever the websocket is torn down, including when connecting fails. Schedules a reconnect."""
+        self.on_connection_lost()
         print("### closed ###")
+        self.reconnector.schedule()
+
+    def on_connection_lost(self):
+        """
+        Marks the connection as down. A connection dropped after sending LOGIN but before VALID_LOGIN means the
+        signature was refused, so the cached one is discarded and the next connection logs in again.
+        """
+        self.ws_active = False
+
+        if self.login_sent:
+            print("Connection lost before VALID_LOGIN, discarding cached signature and login session.")
+            self.drop_login_session()
+            self.login_sent = False
+
+        self.reconnector.on_disconnected()
 
     def on_ws_open(self, ws):
         """
@@ -166,10 +310,27 @@ class Game:
         """
         print("Opened connection.")
         print("Acquiring signature...")
+        cached = self.signature is not None
+        started = time.monotonic()
         signature = self.get_signature()
+        registry.observe("login.signature_cached" if cached else "login.signature_fetched", (time.monotonic() - started) * 1000)
         print("Signature acquired.")
         print("Logging in...")
+        self.login_sent = True
+        self.login_attempt += 1
         self.send_ws_message({"payload": f"LOGIN={signature}"})
+        rel.timeout(LOGIN_TIMEOUT, self.check_login, self.login_attempt)
+
+    def check_login(self, attempt: int):
+        """
+        Drops a connection still waiting for VALID_LOGIN LOGIN_TIMEOUT seconds after sending LOGIN. The server
+        sometimes ignores a stale signature rather than closing the connection, and the drop discards it (see
+        ``on_connection_lost``).
+        """
+        if self.login_sent and attempt == self.login_attempt:
+            print(f"No VALID_LOGIN within {LOGIN_TIMEOUT}s, dropping the connection.")
+            registry.increment("login.timeout")
+            self.reconnector.drop_connection()
 
     def log_ws_message(self, raw_message: str, received: bool):
         message_data = {
@@ -186,6 +347,10 @@ class Game:
         print(formatted_output)
 
     def send_ws_message(self, action: dict):
+        """Queues a frame with the SendScheduler, which writes it out with ``write_ws_message`` once it's due."""
+        self.send_scheduler.submit(action)
+
+    def write_ws_message(self, action: dict):
         message = action["payload"]
 
         if self.development_mode:
@@ -193,12 +358,28 @@ class Game:
         if self.ws_active or message[:5] == "LOGIN":
             try:
                 self.game_ws.send(message)
+                self.record_reply_latency(action)
+                # The signature is a credential, so it isn't kept.
+                self.archive.append("out", "LOGIN" if message[:5] == "LOGIN" else message)
             except Exception as e:
                 print(e)
                 traceback.print_tb(e.__traceback__)
+                if message[:5] != "LOGIN":
+                    self.outbound_buffer.add(action)
         else:
-            print(f"Attempted ws send while offline: {message}")
+            # Held until the next VALID_LOGIN, see set_ws_active.
+            self.outbound_buffer.add(action)
+
+    def record_reply_latency(self, action: dict):
+        """Records the time from receiving the frame which led to ``action`` to sending it, per command."""
+        trace = action.get("trace", None)
+        if trace is None:
+            return
+
+        command = trace["command"] or "no_command"
+        registry.observe(f"reply_latency.{command}", tracing.elapsed_ms(trace))
 
+    @instrumented
     def dispatch(self, action: dict):
         action_target = self.dispatch_map.get(action["action"], None)
 
@@ -215,26 +396,70 @@ class Game:
     def print_items(self, action: dict):
         print(self.game_vars)
 
+    def set_ingress_filter(self, action: dict):
+        """Payload: {"type": frame type, "filter": rule}, see ingress.INGRESS_FILTERS"""
+        rule = action["payload"]
+        if self.ingress_filter.set_filter(rule["type"], rule["filter"]):
+            print(f"Ingress filter for {rule['type']} set to {rule['filter']}")
+
     def set_ws_active(self, action: dict):
         self.ws_active = True
+        self.login_sent = False
+        self.reconnector.on_connected()
+
+        if not self.startup_recorded:
+            self.record_startup_time()
+
+        for buffered_action in self.outbound_buffer.take():
+            self.send_scheduler.submit(buffered_action)
+
+    def record_startup_time(self):
+        """
+        Records how long this process took to reach VALID_LOGIN, from the bot's launch and from the process being
+        spawned (the same thing, unless the supervisor has restarted it). Both are set as monotonic_ns by main.py.
+        """
+        now = time.monotonic_ns()
+        self.startup_recorded = True
+
+        for name, env_var in (("launch", "LUXBOT_LAUNCHED_NS"), ("spawn", "LUXBOT_SPAWNED_NS")):
+            started = os.environ.get(env_var, None)
+            if started is not None:
+                registry.set_gauge(f"startup.{name}_to_valid_login_ms", round((now - int(started)) / 1000000, 3))
 
     def run(self):
         self.env_consts = self.get_env_consts()
 
-        queue_timer = RepeatTimer(0.1, self.check_queue)
-        queue_timer.start()
+        recording_path = os.environ.get("LUXBOT_RECORD", None)
+        if recording_path:
+            self.recording = open(recording_path, "a", buffering=1)
+        registry.start_flushing(connection_target(self.connection_id))
+
+        rel.read(self.game_queue, self.drain_game_queue)
 
         websocket.enableTrace(False)
-        self.game_ws = websocket.WebSocketApp("wss://server1.idle-pixel.com",
+        self.game_ws = websocket.WebSocketApp(self.connection["server"],
                                               on_open=self.on_ws_open,
                                               on_message=self.on_ws_message,
                                               on_error=self.on_ws_error,
                                               on_close=self.on_ws_close,
                                               )
+        self.reconnector.watch(self.game_ws)
 
+        self.connect()
+        try:
+            rel.dispatch()
+        finally:
+            # Also reached on SIGTERM, which main.exit_on_sigterm turns into SystemExit
+            self.archive.close()
+
+    def connect(self):
+        """
+        Opens the websocket on the rel dispatcher. Reconnecting is left to self.reconnector rather than the
+        websocket's own fixed delay, so run_forever returns as soon as the connection is torn down.
+        """
         self.game_ws.run_forever(dispatcher=rel,
-                                 reconnect=60,
+                                 reconnect=0,
+                                 ping_interval=PING_INTERVAL,
                                  sslopt={
                                          "cert_reqs": ssl.CERT_NONE,
-                                 })  # Set dispatcher to automatic reconnection, 5 second reconnect delay if connection closed unexpectedly, no SSL cert
-        rel.dispatch()
+                                 })  # No SSL cert
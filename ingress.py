@@ -0,0 +1,136 @@
+import rel
+
+from metrics import registry
+
+# Frame type (the part of the frame before "=") -> what the Game process does with it before it crosses to the
+# primary process. Frame types not listed are forwarded. Changed at runtime with the game "set_ingress_filter" action.
+#   "forward": sent on to WSHandlers.
+#   "drop": discarded.
+#   "sample:N": only every Nth frame of the type is forwarded.
+#   "aggregate:S": the first frame is forwarded, then only the latest frame of each following S second window.
+INGRESS_FILTERS = {
+    "SET_COUNTRY": "drop",
+    "UPDATE_TIMER": "sample:10",
+    "EVENT_GLOBAL_PROGRESS": "aggregate:1",
+}
+# Added for every game connection but the first, which alone handles the traffic every account receives.
+SHARED_FRAME_FILTERS = {
+    "CHAT": "drop",
+    "YELL": "drop",
+    "UPDATE_TIMER": "drop",
+    "EVENT_GLOBAL_PROGRESS": "drop",
+}
+
+
+def parse_filter(rule: str) -> tuple | None:
+    """Returns (kind, argument) for a filter rule string, or None if it isn't valid."""
+    kind, _, argument = rule.partition(":")
+
+    try:
+        match kind:
+            case "forward" | "drop" if not argument:
+                return kind, None
+            case "sample" if int(argument) > 0:
+                return kind, int(argument)
+            case "aggregate" if float(argument) > 0:
+                return kind, float(argument)
+    except ValueError:
+        pass
+
+    return None
+
+
+class IngressFilter:
+    """
+    Drops, samples or aggregates received websocket frames by type (see INGRESS_FILTERS), so frames nobody needs
+    are never wrapped, encoded and sent over to the primary process. Counts forwarded and filtered frames per type.
+    Runs on the Game process' rel thread.
+    """
+    def __init__(self, forward, filters: dict = None):
+        """
+        :param forward: Called with each raw frame which makes it through the filter.
+        :param filters: Initial filters, {frame type: rule}. Defaults to INGRESS_FILTERS
+        """
+        self.forward = forward
+        self.filters = {}
+        self.sampled = {}
+        self.windows = {}
+        self.counters = {}
+
+        for current_type, rule in (INGRESS_FILTERS if filters is None else filters).items():
+            self.set_filter(current_type, rule)
+
+        registry.add_sampler(self.sample_metrics)
+
+    def set_filter(self, frame_type: str, rule: str) -> bool:
+        parsed_rule = parse_filter(rule)
+
+        if parsed_rule is None:
+            print(f"Invalid ingress filter for {frame_type}: {rule}")
+            return False
+
+        if parsed_rule[0] == "forward":
+            self.filters.pop(frame_type, None)
+        else:
+            self.filters[frame_type] = parsed_rule
+
+        self.sampled.pop(frame_type, None)
+
+        return True
+
+    def count(self, frame_type: str, outcome: str):
+        type_counters = self.counters.get(frame_type, None)
+        if type_counters is None:
+            type_counters = self.counters[frame_type] = {"forwarded": 0, "filtered": 0}
+
+        type_counters[outcome] += 1
+
+    def receive(self, raw_message: str):
+        split_index = raw_message.find("=")
+        frame_type = raw_message if split_index < 0 else raw_message[:split_index]
+        rule = self.filters.get(frame_type, None)
+
+        if rule is None:
+            self.count(frame_type, "forwarded")
+            self.forward(raw_message)
+            return
+
+        kind, argument = rule
+
+        match kind:
+            case "drop":
+                self.count(frame_type, "filtered")
+            case "sample":
+                seen = self.sampled.get(frame_type, 0) + 1
+                self.sampled[frame_type] = seen % argument
+
+                if seen % argument:
+                    self.count(frame_type, "filtered")
+                else:
+                    self.count(frame_type, "forwarded")
+                    self.forward(raw_message)
+            case "aggregate":
+                if frame_type in self.windows:
+                    if self.windows[frame_type] is not None:
+                        self.count(frame_type, "filtered")
+                    self.windows[frame_type] = raw_message
+                else:
+                    self.count(frame_type, "forwarded")
+                    self.forward(raw_message)
+                    self.open_window(frame_type, argument)
+
+    def open_window(self, frame_type: str, length: float):
+        self.windows[frame_type] = None
+        rel.timeout(length, self.close_window, frame_type, length)
+
+    def close_window(self, frame_type: str, length: float):
+        """Forwards the latest frame held during the window, which opens another."""
+        held = self.windows.pop(frame_type, None)
+
+        if held is not None:
+            self.count(frame_type, "forwarded")
+            self.forward(held)
+            self.open_window(frame_type, length)
+
+    def sample_metrics(self) -> dict:
+        return {"ingress": {frame_type: dict(type_counters) for frame_type, type_counters in list(self.counters.items())}}
@@ -4,6 +4,7 @@ from datetime import datetime, timedelta, timezone
 
 from repo import Repo
 from utils import Utils
+from metrics import instrumented
 
 
 class Integrations:
@@ -33,8 +34,14 @@ class Integrations:
                 "target": self.broadcast_event_end
             },
         }
+        # Topic: [dispatch map keys], see Router
+        self.subscriptions = {
+            "chat": ["log_chat_history", "mirror_chat_to_discord"],
+            "yell": ["mirror_yell_to_discord"],
+        }
         self.chat_history = deque([], 5)
 
+    @instrumented
     def dispatch(self, action: dict):
         target_dict = self.dispatch_map.get(action["action"], None)
 
@@ -45,7 +52,7 @@ class Integrations:
         target_dict["target"](action)
 
     def log_chat_history(self, action):
-        chat_data = action["payload"]["payload"]
+        chat_data = action["payload"]["raw"]
         self.chat_history.append(chat_data)
 
     def chat_hist_request(self, action: dict):
@@ -84,8 +91,7 @@ class Integrations:
         send_action = Utils.gen_send_action("custom", reply_data)
         actions.append(send_action)
 
-        for new_action in actions:
-            self.p_q.put(new_action)
+        self.p_q.put(Utils.gen_batch_action(actions, "integration"))
 
     def handle_pet_helper(self, action: dict):
         player = action["payload"]["player"]
@@ -143,7 +149,7 @@ class Integrations:
         message = message_data["message"]
         message_time = message_data["time"]
 
-        timestamp = int(message_time.timestamp())
+        timestamp = message_time // 1_000_000_000
         timestamp_string = f"<t:{timestamp}:t>"
 
         formatted_chat = f'*[{timestamp_string}]* **{player["username"]}:** {message} '
@@ -163,7 +169,7 @@ class Integrations:
         message = message_data["payload"]
         message_time = message_data["time"]
 
-        timestamp = int(message_time.timestamp())
+        timestamp = message_time // 1_000_000_000
         timestamp_string = f"<t:{timestamp}:t>"
 
         formatted_yell = f'*[{timestamp_string}]* **{message}** '
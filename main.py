@@ -1,74 +1,129 @@
-import asyncio
-from multiprocessing import Process, Manager
+import os
+import sys
+import time
+import signal
+
+from functools import partial
+from multiprocessing.process import BaseProcess
 from multiprocessing.queues import Queue
 
-from idle_pixel_bot import Game
-from apis import APIs
-from webapp.webapp import WebApp
+from transport import ActionQueue, PROCESS_CONTEXT
+from connections import load_connections, connection_target
 
-from wshandlers import WSHandlers
-from customs import Customs
-from chat import Chat
-from repo import Repo
-from fun_stuff import Fun
-from mod_stuff import Mod
-from admin_stuff import Admin
-from stats_stuff import Stats
-from event_stuff import Event
-from integration_stuff import Integrations
-from tcg_stuff import TCG
+from router import Router
+from supervisor import Supervisor
+from metrics import registry
+from repo import permission_cache
 
 
 class PrimaryHandler:
-    def __init__(self, p_queue: Queue):
+    def __init__(self, p_queue: Queue, permission_generation):
+        """
+        :param permission_generation: Shared permission cache generation counter, handed on to the webapp process.
+            See repo.PermissionCache
+        """
         self.p_q = p_queue
-        self.db = Repo()
-        self.main_thread = self.create_main_process()
-        self.api_process = self.create_api_process()
-        self.webapp = self.create_webui_process()
-        self.ws_handlers = WSHandlers(self.p_q)
-        self.customs = Customs(self.p_q, self.db)
-        self.chat = Chat(self.p_q, self.db)
-        self.fun = Fun(self.p_q, self.db)
-        self.mod = Mod(self.p_q, self.db)
-        self.admin = Admin(self.p_q, self.db)
-        self.stats = Stats(self.p_q, self.db)
-        self.event = Event(self.p_q, self.db)
-        self.integration = Integrations(self.p_q, self.db)
-        self.tcg = TCG(self.p_q, self.db)
-
-        self.ws_handlers.apply_dispatch_map()
+        self.permission_generation = permission_generation
+        permission_cache.share(permission_generation)
+        self.router = Router(self.p_q, dict(game_queues, api=api_queue))
+        self.supervisor = Supervisor(self.router)
+
+        for connection_id in connections:
+            target = connection_target(connection_id)
+            self.supervisor.add(target, partial(self.create_main_process, connection_id), target)
+        self.supervisor.add("api", self.create_api_process, "api")
+        self.supervisor.add("webapp", self.create_webui_process)
+
+        self.router.add_route("main", self.dispatch)
 
     def dispatch(self, target: dict):
         match target["action"]:
             case "main_start":
-                self.main_thread.start()
-                self.api_process.start()
-                self.webapp.start()
+                self.supervisor.start_all()
             case "main_close":
-                self.main_thread.terminate()
+                for subsystem in self.game_subsystems(target["payload"]):
+                    self.supervisor.stop(subsystem)
             case "main_restart":
-                self.main_thread.terminate()
-                self.main_thread = self.create_main_process()
-                self.main_thread.start()
+                for subsystem in self.game_subsystems(target["payload"]):
+                    self.supervisor.restart(subsystem)
             case _:
                 pass
 
-    def create_main_process(self) -> Process:
-        return Process(target=Game(self.p_q, game_queue).run)
+    @staticmethod
+    def game_subsystems(connection_id: str) -> list[str]:
+        """
+        Supervisor names of the named game connection, or every game connection if none is named. Nothing if the
+        named connection doesn't exist.
+        """
+        if connection_id:
+            if connection_id not in connections:
+                print(f"Unknown game connection: {connection_id}")
+                return []
+
+            return [connection_target(connection_id)]
+
+        return [connection_target(connection_id) for connection_id in connections]
+
+    def create_main_process(self, connection_id: str, remote_queue: Queue) -> BaseProcess:
+        return PROCESS_CONTEXT.Process(target=run_game,
+                                       args=(self.p_q, remote_queue, connection_id, connections[connection_id]))
+
+    def create_api_process(self, remote_queue: Queue) -> BaseProcess:
+        return PROCESS_CONTEXT.Process(target=run_apis, args=(self.p_q, remote_queue))
+
+    def create_webui_process(self) -> BaseProcess:
+        return PROCESS_CONTEXT.Process(target=run_webapp, args=(self.p_q, self.permission_generation))
+
+
+# Process entry points. Each subsystem's dependencies (websocket/rel, discord/aiohttp, fastapi/uvicorn) are imported
+# in its own process only, so none of them weigh on the primary process or on each other's (re)starts.
+def record_import_time(started: int):
+    registry.set_gauge("startup.import_ms", round((time.monotonic_ns() - started) / 1000000, 3))
+
 
-    def create_api_process(self) -> Process:
-        return Process(target=APIs(self.p_q, api_queue).run)
+def exit_on_sigterm():
+    """Turns the Supervisor's SIGTERM into a normal exit, so the process finishes its queue writes and cleans up."""
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-    def create_webui_process(self) -> Process:
-        return Process(target=WebApp(self.p_q).run)
+
+def run_game(p_q: Queue, remote_queue: Queue, connection_id: str, connection: dict):
+    exit_on_sigterm()
+    started = time.monotonic_ns()
+    from idle_pixel_bot import Game
+    record_import_time(started)
+
+    Game(p_q, remote_queue, connection_id, connection).run()
+
+
+def run_apis(p_q: Queue, remote_queue: Queue):
+    exit_on_sigterm()
+    started = time.monotonic_ns()
+    from apis import APIs
+    record_import_time(started)
+
+    APIs(p_q, remote_queue).run()
+
+
+def run_webapp(p_q: Queue, permission_generation):
+    exit_on_sigterm()
+    started = time.monotonic_ns()
+    from webapp.webapp import WebApp
+    record_import_time(started)
+
+    WebApp(p_q, permission_generation).run()
 
 
 if __name__ == '__main__':
-    manager = Manager()
-    primary_queue = manager.Queue()
-    game_queue = manager.Queue()
-    api_queue = manager.Queue()
+    os.environ["LUXBOT_LAUNCHED_NS"] = str(time.monotonic_ns())
+
+    connections = load_connections()
+
+    primary_queue = ActionQueue("primary")
+    game_queues = {connection_target(connection_id): ActionQueue(connection_target(connection_id))
+                   for connection_id in connections}
+    api_queue = ActionQueue("api")
+    # Bumped whenever permissions change, so the primary and webapp processes' permission caches stay in step
+    permission_generation = PROCESS_CONTEXT.Value("L", 0)
 
     main_action = {
         "target": "main",
@@ -77,37 +132,8 @@ if __name__ == '__main__':
         "source": "main",
     }
 
-    primary_handler = PrimaryHandler(primary_queue)
+    primary_handler = PrimaryHandler(primary_queue, permission_generation)
+    registry.start_flushing("primary", schedule=primary_handler.router.add_job)
     primary_handler.p_q.put(main_action)
 
-    while True:
-        action = primary_queue.get()
-        match action["target"]:
-            case "main":
-                primary_handler.dispatch(action)
-            case "game":
-                game_queue.put(action)
-            case "api":
-                api_queue.put(action)
-            case "ws_handlers":
-                primary_handler.ws_handlers.dispatch(action)
-            case "custom":
-                primary_handler.customs.handle(action)
-            case "chat":
-                primary_handler.chat.handle(action)
-            case "fun":
-                primary_handler.fun.dispatch(action)
-            case "mod":
-                primary_handler.mod.dispatch(action)
-            case "admin":
-                primary_handler.admin.dispatch(action)
-            case "stats":
-                primary_handler.stats.dispatch(action)
-            case "event":
-                primary_handler.event.dispatch(action)
-            case "integration":
-                primary_handler.integration.dispatch(action)
-            case "tcg":
-                primary_handler.tcg.dispatch(action)
-            case _:
-                print(f"Invalid primary handler for: {action}")
+    primary_handler.router.run()
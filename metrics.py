@@ -0,0 +1,208 @@
+import os
+import functools
+import inspect
+import time
+
+from threading import Lock
+
+from flow_control import action_key
+from utils import RepeatTimer
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+
+class Histogram:
+    """Fixed bucket latency histogram. Percentiles are reported as the upper bound of the bucket they fall in."""
+    def __init__(self):
+        self.buckets = [0 for _ in LATENCY_BUCKETS_MS]
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms: float):
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if value_ms <= bound:
+                self.buckets[index] += 1
+                break
+
+        self.count += 1
+        self.total += value_ms
+        self.max = max(self.max, value_ms)
+
+    def percentile(self, pct: float) -> float:
+        if not self.count:
+            return 0.0
+
+        threshold = self.count * pct / 100
+        seen = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += bucket_count
+            if seen >= threshold:
+                return round(min(bound, self.max), 3)
+
+        return round(self.max, 3)
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total, 3),
+            "mean_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max, 3),
+        }
+
+
+class Metrics:
+    """
+    Per process registry of dispatch timings, latency histograms, counters and gauges.
+
+    Each process keeps its own ``registry`` and periodically saves a snapshot to the database (see
+    ``start_flushing``), where the webapp's /metrics endpoints read them back from.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Empties the registry. Also runs in forked children (the subsystem processes are spawned, so this only
+        matters to forked helpers such as the benchmark producers), which would otherwise report the parent's samplers
+        and everything it recorded before the fork under their own process name.
+        """
+        self.process = "unknown"
+        self.lock = Lock()
+        self.dispatch = {}
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.samplers = []
+        self.flush_timer = None
+
+    def record_dispatch(self, key: str, elapsed_ms: float, failed: bool):
+        with self.lock:
+            dispatch_stats = self.dispatch.get(key, None)
+            if dispatch_stats is None:
+                dispatch_stats = self.dispatch[key] = {"errors": 0, "latency": Histogram()}
+
+            dispatch_stats["latency"].observe(elapsed_ms)
+            if failed:
+                dispatch_stats["errors"] += 1
+
+    def observe(self, name: str, value_ms: float):
+        with self.lock:
+            histogram = self.histograms.get(name, None)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+
+            histogram.observe(value_ms)
+
+    def increment(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def add_sampler(self, sampler):
+        """Registers a callable returning a dict of gauges (eg queue depths), called whenever a snapshot is taken."""
+        self.samplers.append(sampler)
+
+    def snapshot(self) -> dict:
+        sampled = {}
+        for sampler in self.samplers:
+            try:
+                sampled.update(sampler())
+            except Exception as e:
+                print(f"Metrics sampler error: {e}")
+
+        with self.lock:
+            gauges = dict(self.gauges)
+            gauges.update(sampled)
+
+            return {
+                "process": self.process,
+                "time": time.time(),
+                "dispatch": {
+                    key: dict(dispatch_stats["latency"].summary(), errors=dispatch_stats["errors"])
+                    for key, dispatch_stats in self.dispatch.items()
+                },
+                "histograms": {name: histogram.summary() for name, histogram in self.histograms.items()},
+                "counters": dict(self.counters),
+                "gauges": gauges,
+            }
+
+    def flush(self, db):
+        db.save_metrics({"process": self.process, "snapshot": self.snapshot()})
+
+    def start_flushing(self, process: str, interval: float = 10, schedule=None):
+        """
+        Names this process' registry and starts saving a snapshot of it to the database every ``interval`` seconds.
+        :param schedule: Called as ``schedule(interval, job, *args)`` to run the flush, eg Router.add_job.
+            Defaults to a RepeatTimer thread.
+        """
+        from repo import Repo
+
+        self.process = process
+        db = Repo()
+
+        if schedule is not None:
+            schedule(interval, self.flush, db)
+            return
+
+        self.flush_timer = RepeatTimer(interval, self.flush, args=(db,))
+        self.flush_timer.daemon = True
+        self.flush_timer.start()
+
+
+registry = Metrics()
+os.register_at_fork(after_in_child=registry.reset)
+
+
+def instrumented(dispatch):
+    """
+    Decorator for module ``dispatch`` methods. Records call count, latency and errors per action
+    (keyed by ``flow_control.action_key``) in this process' registry.
+    """
+    if inspect.iscoroutinefunction(dispatch):
+        @functools.wraps(dispatch)
+        async def wrapper(self, action: dict):
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = await dispatch(self, action)
+                failed = False
+                return result
+            finally:
+                registry.record_dispatch(action_key(action), (time.perf_counter() - start) * 1000, failed)
+    else:
+        @functools.wraps(dispatch)
+        def wrapper(self, action: dict):
+            start = time.perf_counter()
+            try:
+                result = dispatch(self, action)
+            except BaseException:
+                registry.record_dispatch(action_key(action), (time.perf_counter() - start) * 1000, True)
+                raise
+
+            # Dispatches to async targets return the target's coroutine, which is only timed once awaited
+            if inspect.isawaitable(result):
+                return timed(result, action, start)
+
+            registry.record_dispatch(action_key(action), (time.perf_counter() - start) * 1000, False)
+            return result
+
+    return wrapper
+
+
+async def timed(awaitable, action: dict, start: float):
+    """Awaits a coroutine returned by an ``instrumented`` dispatch, recording it from when the dispatch started."""
+    failed = True
+    try:
+        result = await awaitable
+        failed = False
+        return result
+    finally:
+        registry.record_dispatch(action_key(action), (time.perf_counter() - start) * 1000, failed)
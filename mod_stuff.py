@@ -3,7 +3,8 @@ import random
 from multiprocessing.queues import Queue
 
 from repo import Repo
-from utils import Utils, RepeatTimer
+from utils import Utils
+from metrics import instrumented
 
 
 class Mod:
@@ -35,6 +36,17 @@ class Mod:
             "handle_automod": {
                 "target": self.handle_automod
             },
+            "poll_online_mods": {
+                "target": self.poll_online_mods
+            },
+        }
+        # Topic: [dispatch map keys], see Router
+        self.subscriptions = {
+            "chat": ["handle_automod", "handle_at_mods"],
+        }
+        # Dispatch map key: interval in seconds, see Router
+        self.schedule = {
+            "poll_online_mods": 60,
         }
         self.modmod_dispatch_map = {
             "HELLO": {
@@ -53,9 +65,7 @@ class Mod:
         self.whois_requester = None
         self.online_mods = set()
 
-        mod_poll_timer = RepeatTimer(60, self.poll_online_mods)
-        mod_poll_timer.start()
-
+    @instrumented
     def dispatch(self, action: dict):
         target_dict = self.dispatch_map.get(action["action"], None)
 
@@ -104,6 +114,8 @@ class Mod:
         else:
             mods = [message_data["player"]]
 
+        actions = []
+
         for mod in mods:
             send_data = {
                 "player": mod,
@@ -115,10 +127,13 @@ class Mod:
             send_action = Utils.gen_send_action("custom", send_data)
 
             if send_action:
-                self.p_q.put(send_action)
+                actions.append(send_action)
             else:
                 print("mod_stuff error: Invalid source for send.")
 
+        if actions:
+            self.p_q.put(Utils.gen_batch_action(actions, "mod"))
+
     def modmod_hello(self, action: dict):
         if action['payload']['parsed_command']['payload'] == "1:0":
             message_data = {
@@ -187,7 +202,7 @@ class Mod:
         self.send_modmod_message(message_data)
     # End ModMod Stuff
 
-    def poll_online_mods(self):
+    def poll_online_mods(self, action: dict):
         message_data = {
             "player": "ALL",
             "command": "HELLO",
@@ -259,8 +274,7 @@ class Mod:
             Utils.gen_send_action("chat", {"payload": random.choice(automod_replies)})
         ]
 
-        for new_action in actions:
-            self.p_q.put(new_action)
+        self.p_q.put(Utils.gen_batch_action(actions, "mod"))
         return
 
     def update_triggers(self, action: dict):
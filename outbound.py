@@ -0,0 +1,323 @@
+import os
+import json
+import time
+
+from collections import deque
+
+import rel
+
+from metrics import registry
+
+# Frame type (the part of the frame before "=") -> send policy.
+#   "priority": lower goes first whenever the shared budget (ALL_FRAMES) is what's holding frames back.
+#   "rate", "burst": token bucket for the frame type, frames per second and how many may go back to back.
+# The server doesn't publish its flood limits, so these are conservative. Tune them against the send_rate metrics.
+SEND_POLICIES = {
+    "MUTE": {"priority": 0, "rate": 5, "burst": 10},
+    "CHAT": {"priority": 1, "rate": 2, "burst": 5},
+    "GIVE_TCG_CARD": {"priority": 2, "rate": 5, "burst": 10},
+    "CUSTOM": {"priority": 3, "rate": 10, "burst": 20},
+}
+DEFAULT_SEND_POLICY = {"priority": 2, "rate": 5, "burst": 10}
+# Budget shared by every frame type.
+ALL_FRAMES = {"rate": 20, "burst": 40}
+# Sent straight away, ahead of anything queued.
+UNSCHEDULED_FRAMES = {"LOGIN"}
+# Most frames of one type kept waiting for their bucket. Past this, new frames of the type are dropped.
+SEND_QUEUE_LIMIT = 1000
+# Frame type -> seconds a frame sent while the websocket is down stays worth sending once it's back, see
+# OutboundBuffer. Types not listed keep for DEFAULT_BUFFER_TTL.
+BUFFER_TTLS = {
+    "MUTE": 3600,
+    "CHAT": 120,
+    "GIVE_TCG_CARD": 86400,
+    "CUSTOM": 600,
+}
+DEFAULT_BUFFER_TTL = 300
+# Most frames kept. Past this, the worst priority, newest frame is dropped.
+BUFFER_LIMIT = 1000
+
+
+def frame_type(frame: str) -> str:
+    return frame.split("=", 1)[0]
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready(self, now: float) -> bool:
+        self.refill(now)
+        return self.tokens >= 1
+
+    def take(self):
+        self.tokens -= 1
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available."""
+        self.refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class SendScheduler:
+    """
+    Paces outbound websocket frames for the Game process.
+
+    Each frame type has its own token bucket (SEND_POLICIES), and all of them share the ALL_FRAMES bucket. Whenever
+    frames of several types could go, the highest priority goes first, so a burst of CUSTOM pages or TCG card
+    transfers never holds up a MUTE or a chat reply. A frame identical to one already waiting is coalesced into it.
+    At most SEND_QUEUE_LIMIT frames of each type wait, and a frame which waited longer than its BUFFER_TTLS is dropped
+    rather than sent.
+
+    Frames go out as soon as their buckets allow. Otherwise a rel timeout is set for when the next one can.
+    """
+    def __init__(self, write):
+        """
+        :param write: Called with each action when its frame is due to be written to the websocket.
+        """
+        self.write = write
+        self.queues = {}
+        self.waiting = {}
+        self.buckets = {}
+        self.all_frames = TokenBucket(ALL_FRAMES["rate"], ALL_FRAMES["burst"])
+        self.timer_set = False
+        self.sent = {}
+        self.last_sample = (time.monotonic(), {})
+
+        registry.add_sampler(self.sample_metrics)
+
+    def __len__(self) -> int:
+        return sum(len(frames) for frames in self.queues.values())
+
+    def submit(self, action: dict):
+        frame = action["payload"]
+        current_type = frame_type(frame)
+
+        if current_type in UNSCHEDULED_FRAMES:
+            self.write(action)
+            return
+
+        frames = self.queues.get(current_type, None)
+        if frames is None:
+            policy = SEND_POLICIES.get(current_type, DEFAULT_SEND_POLICY)
+            frames = self.queues[current_type] = deque()
+            self.waiting[current_type] = set()
+            self.buckets[current_type] = TokenBucket(policy["rate"], policy["burst"])
+
+        waiting = self.waiting[current_type]
+        if frame in waiting:
+            registry.increment(f"send_coalesced.{current_type}")
+            return
+
+        if len(frames) >= SEND_QUEUE_LIMIT:
+            registry.increment(f"send_dropped.{current_type}")
+            return
+
+        frames.append((time.monotonic(), action))
+        waiting.add(frame)
+        self.pump()
+
+    def pump(self):
+        """Sends every frame whose buckets allow it, best priority first, then waits for the next to be due."""
+        while True:
+            now = time.monotonic()
+            self.expire(now)
+            if not self.all_frames.ready(now):
+                break
+
+            next_type = self.next_ready_type(now)
+            if next_type is None:
+                break
+
+            queued, action = self.queues[next_type].popleft()
+            self.waiting[next_type].discard(action["payload"])
+            self.buckets[next_type].take()
+            self.all_frames.take()
+
+            self.sent[next_type] = self.sent.get(next_type, 0) + 1
+            registry.observe(f"send_delay.{next_type}", (now - queued) * 1000)
+            self.write(action)
+
+        self.set_timer()
+
+    def expire(self, now: float):
+        """Drops frames which have waited longer than their type's BUFFER_TTLS. The oldest are at the front."""
+        for current_type, frames in self.queues.items():
+            ttl = BUFFER_TTLS.get(current_type, DEFAULT_BUFFER_TTL)
+
+            while frames and now - frames[0][0] > ttl:
+                _, action = frames.popleft()
+                self.waiting[current_type].discard(action["payload"])
+                registry.increment(f"send_expired.{current_type}")
+
+    def next_ready_type(self, now: float) -> str | None:
+        """Frame type to send next: the best priority with a frame waiting and a token, oldest first on a tie."""
+        best = None
+        best_rank = None
+
+        for current_type, frames in self.queues.items():
+            if not frames or not self.buckets[current_type].ready(now):
+                continue
+
+            rank = (SEND_POLICIES.get(current_type, DEFAULT_SEND_POLICY)["priority"], frames[0][0])
+            if best_rank is None or rank < best_rank:
+                best = current_type
+                best_rank = rank
+
+        return best
+
+    def set_timer(self):
+        if self.timer_set or not len(self):
+            return
+
+        now = time.monotonic()
+        waits = [self.buckets[current_type].wait_time(now) for current_type, frames in self.queues.items() if frames]
+        delay = max(min(waits), self.all_frames.wait_time(now))
+
+        self.timer_set = True
+        rel.timeout(delay, self.on_timer)
+
+    def on_timer(self):
+        self.timer_set = False
+        self.pump()
+
+    def sample_metrics(self) -> dict:
+        """Send rate per frame type since the last sample, and how many frames of each type are waiting."""
+        now = time.monotonic()
+        last_time, last_sent = self.last_sample
+        elapsed = max(now - last_time, 1e-9)
+        sent = dict(self.sent)
+        self.last_sample = (now, sent)
+
+        return {
+            "send_rate": {
+                current_type: round((count - last_sent.get(current_type, 0)) / elapsed, 3)
+                for current_type, count in sent.items()
+            },
+            "send_waiting": {current_type: len(frames) for current_type, frames in list(self.queues.items())},
+            "sent": sent,
+        }
+
+
+class OutboundBuffer:
+    """
+    Holds frames the Game process tried to send while its websocket was down, until the next VALID_LOGIN.
+
+    Each frame type is only worth sending for so long (BUFFER_TTLS): a chat reply an hour late is noise, a TCG card
+    transfer is still owed. Frames past their TTL are dropped rather than sent. The buffer is written to ``path`` on
+    every change, so frames survive the process being restarted, and are loaded back when it starts.
+    """
+    def __init__(self, path: str):
+        """
+        :param path: JSON file the buffer is kept in.
+        """
+        self.path = path
+        self.frames = []
+        self.counters = {"buffered": {}, "expired": {}, "delivered": {}, "overflowed": {}}
+
+        self.load()
+        registry.add_sampler(self.sample_metrics)
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def count(self, outcome: str, current_type: str):
+        type_counters = self.counters[outcome]
+        type_counters[current_type] = type_counters.get(current_type, 0) + 1
+
+    def add(self, action: dict):
+        frame = action["payload"]
+        current_type = frame_type(frame)
+
+        self.frames.append({
+            "frame": frame,
+            "buffered": time.time(),
+            "source": action.get("source", None),
+            "trace": action.get("trace", None),
+        })
+        self.count("buffered", current_type)
+
+        if len(self.frames) > BUFFER_LIMIT:
+            self.frames.sort(key=self.rank)
+            self.count("overflowed", frame_type(self.frames.pop()["frame"]))
+
+        self.save()
+
+    @staticmethod
+    def rank(buffered: dict) -> tuple:
+        """Flush order: best priority first, oldest first on a tie."""
+        policy = SEND_POLICIES.get(frame_type(buffered["frame"]), DEFAULT_SEND_POLICY)
+        return policy["priority"], buffered["buffered"]
+
+    def expire(self):
+        now = time.time()
+        live = []
+
+        for buffered in self.frames:
+            current_type = frame_type(buffered["frame"])
+            if now - buffered["buffered"] > BUFFER_TTLS.get(current_type, DEFAULT_BUFFER_TTL):
+                self.count("expired", current_type)
+            else:
+                live.append(buffered)
+
+        self.frames = live
+
+    def take(self) -> list[dict]:
+        """Empties the buffer, returning the frames still within their TTL as send actions, in flush order."""
+        self.expire()
+        actions = []
+
+        for buffered in sorted(self.frames, key=self.rank):
+            action = {
+                "target": "game",
+                "action": "send_ws_message",
+                "payload": buffered["frame"],
+                "source": buffered["source"],
+            }
+            if buffered["trace"] is not None:
+                action["trace"] = buffered["trace"]
+
+            self.count("delivered", frame_type(buffered["frame"]))
+            actions.append(action)
+
+        self.frames = []
+        self.save()
+
+        return actions
+
+    def load(self):
+        try:
+            with open(self.path) as buffer_file:
+                self.frames = json.load(buffer_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Couldn't load the outbound buffer from {self.path}: {e}")
+            return
+
+        self.expire()
+        if self.frames:
+            print(f"Loaded {len(self.frames)} buffered frames from {self.path}")
+
+    def save(self):
+        """Writes the buffer to a temporary file which then replaces ``path``, so a crash never leaves half a file."""
+        temporary_path = f"{self.path}.tmp"
+
+        try:
+            with open(temporary_path, "w") as buffer_file:
+                json.dump(self.frames, buffer_file)
+            os.replace(temporary_path, self.path)
+        except OSError as e:
+            print(f"Couldn't save the outbound buffer to {self.path}: {e}")
+
+    def sample_metrics(self) -> dict:
+        metrics = {"outbound_buffer": {outcome: dict(type_counters) for outcome, type_counters in self.counters.items()}}
+        metrics["outbound_buffer"]["waiting"] = len(self.frames)
+        return metrics
@@ -0,0 +1,168 @@
+import time
+import random
+import socket
+
+from datetime import date, datetime, timedelta
+
+import rel
+
+from metrics import registry
+
+# Seconds before the first reconnect attempt after a drop. Most drops are momentary, so this is short.
+RECONNECT_FIRST = 1
+# Each attempt after the first waits twice as long as the one before, starting from RECONNECT_BASE, up to RECONNECT_MAX.
+RECONNECT_BASE = 5
+RECONNECT_MAX = 300
+# Each delay is shortened by a random fraction up to this, so several connections dropped at once don't all retry
+# in step.
+RECONNECT_JITTER = 0.5
+# A ping is sent every PING_INTERVAL seconds. A connection with no pong PING_TIMEOUT seconds after a ping is treated
+# as half-open (the server is gone but nothing told the socket) and is closed, which starts reconnecting.
+PING_INTERVAL = 30
+PING_TIMEOUT = 10
+# Days of attempt and offline counts kept for the metrics.
+HISTORY_DAYS = 7
+
+
+class ReconnectController:
+    """
+    Reconnects the Game process' websocket after it drops: quickly the first time, then with exponential backoff and
+    jitter up to RECONNECT_MAX. Backoff starts over once a connection reaches VALID_LOGIN.
+
+    Also watches for half-open connections with ping/pong, and counts reconnect attempts and seconds spent offline
+    per day. Runs on the Game process' rel thread.
+    """
+    def __init__(self, connect, app=None):
+        """
+        :param connect: Called to open a new connection.
+        :param app: The websocket.WebSocketApp, for the ping/pong watchdog. Can be set later, see ``watch``.
+        """
+        self.connect = connect
+        self.app = app
+        self.attempt = 0
+        self.pending = False
+        self.watching = False
+        self.offline_since = None
+        self.disconnected_at = None
+        self.attempts = {}
+        self.offline_seconds = {}
+
+        registry.add_sampler(self.sample_metrics)
+
+    def next_delay(self) -> float:
+        if self.attempt == 0:
+            delay = RECONNECT_FIRST
+        else:
+            delay = min(RECONNECT_MAX, RECONNECT_BASE * 2 ** (self.attempt - 1))
+
+        return delay * (1 - random.uniform(0, RECONNECT_JITTER))
+
+    def schedule(self):
+        """Sets a timer for the next reconnect attempt, unless one is already set."""
+        if self.pending:
+            return
+
+        delay = self.next_delay()
+        self.attempt += 1
+        self.pending = True
+
+        print(f"Reconnecting in {delay:.1f}s (attempt {self.attempt})")
+        rel.timeout(delay, self.retry)
+
+    def retry(self):
+        self.pending = False
+        today = date.today().isoformat()
+        self.attempts[today] = self.attempts.get(today, 0) + 1
+        self.trim(self.attempts)
+
+        self.connect()
+
+    def on_disconnected(self):
+        if self.offline_since is None:
+            self.offline_since = time.time()
+            self.disconnected_at = time.monotonic()
+
+    def on_connected(self):
+        """Called on VALID_LOGIN."""
+        self.attempt = 0
+
+        if self.offline_since is not None:
+            registry.observe("login.reconnect", (time.monotonic() - self.disconnected_at) * 1000)
+            self.add_offline(self.offline_since, time.time())
+            self.offline_since = None
+            self.disconnected_at = None
+
+    def add_offline(self, start: float, end: float):
+        """Adds the offline time between two timestamps to the days it fell on."""
+        start_time = datetime.fromtimestamp(start)
+        end_time = datetime.fromtimestamp(end)
+
+        while start_time < end_time:
+            next_midnight = datetime.combine(start_time.date() + timedelta(days=1), datetime.min.time())
+            period_end = min(end_time, next_midnight)
+            day = start_time.date().isoformat()
+
+            self.offline_seconds[day] = self.offline_seconds.get(day, 0) + (period_end - start_time).total_seconds()
+            start_time = period_end
+
+        self.trim(self.offline_seconds)
+
+    @staticmethod
+    def trim(per_day: dict):
+        for day in sorted(per_day)[:-HISTORY_DAYS]:
+            del per_day[day]
+
+    def watch(self, app):
+        """Starts checking ``app`` for pongs, see PING_TIMEOUT."""
+        self.app = app
+
+        if not self.watching:
+            self.watching = True
+            rel.timeout(PING_TIMEOUT / 2, self.check_pong)
+
+    def check_pong(self) -> bool:
+        """
+        Shuts down a connection whose last ping went unanswered for PING_TIMEOUT. Shutting down the socket (rather
+        than closing it) wakes its rel read event, so the websocket tears down and reports the close as usual.
+        Returns True so rel keeps calling it.
+        """
+        app = self.app
+        ws = app.sock if app is not None else None
+
+        if ws is None or not ws.connected or not app.last_ping_tm:
+            return True
+
+        if app.last_pong_tm < app.last_ping_tm and time.time() - app.last_ping_tm > PING_TIMEOUT:
+            print(f"No pong for {PING_TIMEOUT}s, closing half-open connection.")
+            registry.increment("reconnect.half_open")
+            self.drop_connection()
+
+        return True
+
+    def drop_connection(self):
+        """Shuts down the current connection's socket, which tears it down and starts reconnecting."""
+        ws = self.app.sock if self.app is not None else None
+        if ws is None or ws.sock is None:
+            return
+
+        try:
+            ws.sock.shutdown(socket.SHUT_RDWR)
+        except OSError as e:
+            print(e)
+
+    def sample_metrics(self) -> dict:
+        offline_seconds = dict(self.offline_seconds)
+
+        if self.offline_since is not None:
+            today = date.today().isoformat()
+            ongoing = time.time() - max(self.offline_since, datetime.combine(date.today(), datetime.min.time()).timestamp())
+            offline_seconds[today] = offline_seconds.get(today, 0) + ongoing
+
+        return {
+            "reconnect": {
+                "attempts": dict(self.attempts),
+                "offline_seconds": {day: round(seconds, 3) for day, seconds in offline_seconds.items()},
+                "backoff_attempt": self.attempt,
+                "offline": self.offline_since is not None,
+            }
+        }
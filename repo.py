@@ -1,5 +1,102 @@
+import os
 import sqlite3
 import json
+import time
+
+from threading import Lock
+
+from metrics import registry
+
+# Seconds a cached permission level is trusted. Changes made through Repo reach every process sharing the generation
+# counter straight away (see PermissionCache), so this only bounds how long an edit made to the db by hand goes unseen.
+PERMISSION_TTL = 300
+
+
+class PermissionCache:
+    """
+    Permission levels by player, so Chat.parse_chat and Customs.handle don't query the db for every frame.
+
+    Each process has one (``permission_cache``), shared by all its Repos. Repo.update_permission and
+    Repo.set_cheaters_permissions invalidate it and bump ``generation``. When that is a multiprocessing.Value shared
+    with the other processes (see ``share``), their caches see the new generation on their next lookup and empty
+    themselves too.
+    """
+    def __init__(self, ttl: float = PERMISSION_TTL):
+        self.ttl = ttl
+        self.levels = {}
+        self.lock = Lock()
+        self.generation = None
+        self.seen_generation = 0
+        self.counters = {"hits": 0, "misses": 0}
+        # Sampled only once the process has looked a permission up, so processes that never do don't report it
+        self.sampled = False
+
+    def share(self, generation):
+        """
+        :param generation: multiprocessing.Value("L") created by the primary process and passed to the others.
+        """
+        with self.lock:
+            self.generation = generation
+            self.seen_generation = generation.value
+            self.levels.clear()
+
+    def current_generation(self) -> int:
+        return self.seen_generation if self.generation is None else self.generation.value
+
+    def get(self, player: str) -> int | None:
+        generation = self.current_generation()
+
+        with self.lock:
+            if not self.sampled:
+                self.sampled = True
+                registry.add_sampler(self.sample_metrics)
+
+            if generation != self.seen_generation:
+                self.levels.clear()
+                self.seen_generation = generation
+
+            cached = self.levels.get(player, None)
+            if cached is not None and cached[1] > time.monotonic():
+                self.counters["hits"] += 1
+                return cached[0]
+
+            self.counters["misses"] += 1
+            return None
+
+    def set(self, player: str, level: int, generation: int):
+        """
+        Caches a level read from the db. ``generation`` is the one from before the read, so a level read while another
+        process was changing it isn't kept.
+        """
+        with self.lock:
+            if generation == self.current_generation():
+                self.levels[player] = (level, time.monotonic() + self.ttl)
+
+    def invalidate(self):
+        with self.lock:
+            self.levels.clear()
+
+            if self.generation is None:
+                self.seen_generation += 1
+            else:
+                with self.generation.get_lock():
+                    self.generation.value += 1
+                    self.seen_generation = self.generation.value
+
+    def sample_metrics(self) -> dict:
+        hits, misses = self.counters["hits"], self.counters["misses"]
+
+        return {
+            "permission_cache": {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+                "size": len(self.levels),
+            }
+        }
+
+
+permission_cache = PermissionCache()
 
 
 class Repo:
@@ -76,6 +173,7 @@ class Repo:
                 """
         params = (updated_player, level)
         self.database.set_db(query, params)
+        permission_cache.invalidate()
 
     def set_cheaters_permissions(self, payload: dict):
         cheater_list = payload["cheater_list"]
@@ -91,6 +189,7 @@ class Repo:
             cur.execute(query, params)
 
         self.database.con.commit()
+        permission_cache.invalidate()
 
     def get_pet_link(self, payload: dict):
         pet_name = payload.get("pet", None)
@@ -122,22 +221,57 @@ class Repo:
 
         return pet_data
 
+    def save_metrics(self, payload: dict):
+        process = payload["process"]
+        snapshot = payload["snapshot"]
+
+        self.database.set_db(
+            "CREATE TABLE IF NOT EXISTS metrics(process TEXT PRIMARY KEY, data TEXT)",
+            tuple()
+        )
+
+        query = """
+                    INSERT INTO metrics(process, data) VALUES(?1, ?2)
+                    ON CONFLICT(process) DO UPDATE SET data=?2
+                """
+        params = (process, json.dumps(snapshot))
+        self.database.set_db(query, params)
+
+    def read_metrics(self) -> dict:
+        query = "SELECT process, data FROM metrics"
+        params = tuple()
+
+        try:
+            rows = self.database.fetch_db(query, params, True)
+        except sqlite3.OperationalError:  # No process has flushed its metrics yet
+            return {}
+
+        return {process: json.loads(data) for process, data in rows}
+
     def permission_level(self, payload: dict):
         player = payload["player"]
 
+        cached_level = permission_cache.get(player)
+        if cached_level is not None:
+            return cached_level
+
+        generation = permission_cache.current_generation()
+
         query = "SELECT level FROM permissions WHERE user=?"
         params = (player,)
 
         level = self.database.fetch_db(query, params, False)
-        if level is None:
-            return 0
-        else:
-            return level[0]
+        level = 0 if level is None else level[0]
+
+        permission_cache.set(player, level, generation)
+
+        return level
 
 
 class SQLiteDB:
     def __init__(self):
-        self.con = sqlite3.connect("configs.db")
+        # Each handler module has its own Repo, used only from that module's worker thread (see router.ModuleWorker)
+        self.con = sqlite3.connect(os.environ.get("LUXBOT_DB", "configs.db"), check_same_thread=False)
 
     def fetch_db(self, query: str, params: tuple, many: bool):
         cur = self.con.cursor()
@@ -0,0 +1,395 @@
+import asyncio
+import inspect
+import queue
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.queues import Queue
+
+import tracing
+
+from connections import connection_target
+from flow_control import PriorityInbox, Outbox
+from game_state import KeyFilter
+from metrics import registry
+from repo import Repo
+from wshandlers import WSHandlers
+from customs import Customs
+from chat import Chat
+from fun_stuff import Fun
+from mod_stuff import Mod
+from admin_stuff import Admin
+from stats_stuff import Stats
+from event_stuff import Event
+from integration_stuff import Integrations
+from tcg_stuff import TCG
+
+WORKER_BATCH_SIZE = 64
+# Seconds between flushes of outboxes holding actions back, see flush_outboxes.
+OUTBOX_FLUSH_INTERVAL = 0.05
+
+
+class ModuleWorker:
+    """
+    Runs a single handler module as a task on the primary event loop.
+    Handlers are called on the worker's own single thread executor, so a slow synchronous handler only delays its own
+    module's actions and never the loop. A handler which returns a coroutine (eg an async Admin target) has it awaited
+    on the loop instead, so I/O bound handlers wait without holding a thread.
+    Actions are handled one at a time, in the order they were routed, each with its trace made current.
+    """
+    def __init__(self, name: str, handler):
+        """
+        :param name: Target name of the module, eg "stats"
+        :type name: str
+        :param handler: The module's entry point, eg Stats.dispatch
+        """
+        self.name = f"{name}_worker"
+        self.handler = handler
+        self.inbox = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.name)
+
+    def put(self, action: dict):
+        self.inbox.put_nowait(action)
+
+    def handle(self, action: dict):
+        with tracing.activate(action.get("trace", None)):
+            return self.handler(action)
+
+    def handle_batch(self, actions: list) -> tuple:
+        """
+        Handles ``actions`` in order on the executor thread, until one returns an awaitable.
+        :return: (awaitable or None, the action it belongs to, the actions still to be handled)
+        """
+        for index, action in enumerate(actions):
+            try:
+                result = self.handle(action)
+            except Exception as e:
+                self.report_error(action, e)
+                continue
+
+            if inspect.isawaitable(result):
+                return result, action, actions[index + 1:]
+
+        return None, None, []
+
+    def report_error(self, action: dict, e: Exception):
+        print(f"{self.name} error handling {action['action']}: {e}")
+        traceback.print_tb(e.__traceback__)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            # Everything already waiting goes to the executor in one hop, handing each action over is the costly part.
+            actions = [await self.inbox.get()]
+            while not self.inbox.empty() and len(actions) < WORKER_BATCH_SIZE:
+                actions.append(self.inbox.get_nowait())
+
+            while actions:
+                pending, action, actions = await loop.run_in_executor(self.executor, self.handle_batch, actions)
+                if pending is None:
+                    continue
+
+                try:
+                    with tracing.activate(action.get("trace", None)):
+                        await pending
+                except Exception as e:
+                    self.report_error(action, e)
+
+
+class Router:
+    """
+    Routes actions taken off the primary queue to the handler modules.
+
+    Point to point actions are looked up by their target in ``routes``.
+    Published actions (target "publish", action is the topic) are looked up in ``topics`` and delivered to every
+    module which subscribed to that topic, and no others. A subscription given as {dispatch key: [key patterns]}
+    instead of [dispatch keys] only receives the payload items whose keys match, eg {"handle_set_items": ["event_*"]},
+    and nothing at all if none do.
+    Both tables are built once at startup, from the ``subscriptions`` each module declares.
+
+    Each game connection has its own remote target ("game:<id>"). Actions for "game" go back through the connection
+    named in their trace, ie the one the frame they answer came in on, or the first connection if they have none.
+
+    Every module runs on its own ModuleWorker, so routing only ever hands an action to a worker's inbox or a remote
+    process' queue and never waits on a handler.
+
+    Everything runs on a single asyncio event loop: the primary queue is read when its pipe becomes readable, and
+    scheduled jobs (each module's ``schedule`` of dispatch map key to interval, plus any ``add_job``) are loop tasks.
+    """
+    def __init__(self, p_q: Queue, remotes: dict):
+        """
+        :param p_q: Primary queue. Handed to the modules for communicating messages up to the primary handler
+        :type p_q: multiprocessing.queues.Queue
+        :param remotes: Map of target name to the queue of the process handling it.
+            eg {"game:main": game_queue, "api": api_queue}, see connections.connection_target
+        :type remotes: dict
+        """
+        self.p_q = p_q
+        # Modules get a Repo each, sqlite connections aren't safe to share between worker threads.
+        self.ws_handlers = WSHandlers(self.p_q)
+        self.customs = Customs(self.p_q, Repo())
+        self.chat = Chat(self.p_q, Repo())
+        self.fun = Fun(self.p_q, Repo())
+        self.mod = Mod(self.p_q, Repo())
+        self.admin = Admin(self.p_q, Repo())
+        self.stats = Stats(self.p_q, Repo())
+        self.event = Event(self.p_q, Repo())
+        self.integration = Integrations(self.p_q, Repo())
+        self.tcg = TCG(self.p_q, Repo())
+
+        self.ws_handlers.apply_dispatch_map()
+
+        self.workers = {
+            "ws_handlers": ModuleWorker("ws_handlers", self.ws_handlers.dispatch),
+            "custom": ModuleWorker("custom", self.customs.handle),
+            "chat": ModuleWorker("chat", self.chat.handle),
+            "fun": ModuleWorker("fun", self.fun.dispatch),
+            "mod": ModuleWorker("mod", self.mod.dispatch),
+            "admin": ModuleWorker("admin", self.admin.dispatch),
+            "stats": ModuleWorker("stats", self.stats.dispatch),
+            "event": ModuleWorker("event", self.event.dispatch),
+            "integration": ModuleWorker("integration", self.integration.dispatch),
+            "tcg": ModuleWorker("tcg", self.tcg.dispatch),
+        }
+
+        self.routes = {
+            "batch": self.unpack_batch,
+            "publish": self.publish,
+        }
+
+        for target, worker in self.workers.items():
+            self.routes[target] = worker.put
+        # Remote processes can't declare their own subscriptions without being imported into the primary process.
+        remote_subscriptions = {
+            "game": {
+                "set_items": ["set_items"],
+            },
+        }
+
+        self.inbox = PriorityInbox()
+        self.outboxes = {target: Outbox(target, remote_queue) for target, remote_queue in remotes.items()}
+
+        for target, outbox in self.outboxes.items():
+            self.routes[target] = outbox.put
+
+        self.game_connections = [target.split(":", 1)[1] for target in remotes if target.startswith("game:")]
+        if self.game_connections:
+            self.routes["game"] = self.route_game
+
+        self.topics = {}
+        subscribers = {
+            "fun": self.fun.subscriptions,
+            "mod": self.mod.subscriptions,
+            "stats": self.stats.subscriptions,
+            "event": self.event.subscriptions,
+            "integration": self.integration.subscriptions,
+            "tcg": self.tcg.subscriptions,
+        }
+        subscribers.update({target: subscriptions for target, subscriptions in remote_subscriptions.items() if target in self.routes})
+
+        for target, subscriptions in subscribers.items():
+            for topic, actions in subscriptions.items():
+                for action_name in actions:
+                    key_filter = KeyFilter(actions[action_name]) if isinstance(actions, dict) else None
+                    self.topics.setdefault(topic, []).append((self.routes[target], target, action_name, key_filter))
+
+        self.schedules = {
+            "mod": self.mod.schedule,
+        }
+        self.jobs = []
+        self.wakeup = None
+
+        self.counters = {
+            "batches": 0,
+            "batched_actions": 0,
+            "puts_saved": 0,
+            "published": 0,
+            "deliveries": 0,
+            "filtered_deliveries": 0,
+            "filtered_keys": 0,
+        }
+
+        registry.add_sampler(self.sample_metrics)
+
+    def add_route(self, target: str, handler):
+        """Registers a handler outside the modules (eg the primary handler's own process management)."""
+        self.routes[target] = handler
+
+    def add_job(self, interval: float, job, *args):
+        """Runs ``job(*args)`` every ``interval`` seconds on the loop's default executor, once the loop is running."""
+        self.jobs.append((interval, job, args))
+
+    def route(self, action: dict):
+        handler = self.routes.get(action["target"], None)
+
+        if handler is None:
+            print(f"Invalid primary handler for: {action}")
+            return
+
+        handler(action)
+
+    def route_reporting_errors(self, action: dict):
+        """Routes an action, reporting rather than raising any error, so one bad action can't end the primary loop."""
+        try:
+            self.route(action)
+        except Exception as e:
+            print(f"Router error routing {action.get('action', None)} to {action.get('target', None)}: {e}")
+            traceback.print_tb(e.__traceback__)
+
+    def run(self):
+        """Runs the primary event loop. Never returns."""
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        """
+        Primary loop. The primary queue is drained into the PriorityInbox whenever its pipe is readable, and the
+        loop yields between routes so that happens before every route, so moderation actions overtake any backlog
+        of bulk traffic.
+        Outboxes holding actions back are flushed by their own task, see flush_outboxes.
+        """
+        loop = asyncio.get_running_loop()
+        inbox = self.inbox
+        self.wakeup = asyncio.Event()
+
+        tasks = [asyncio.create_task(worker.run(), name=worker.name) for worker in self.workers.values()]
+        for target, schedule in self.schedules.items():
+            for action_name, interval in schedule.items():
+                tasks.append(asyncio.create_task(self.run_schedule(target, action_name, interval)))
+        for interval, job, args in self.jobs:
+            tasks.append(asyncio.create_task(self.run_job(interval, job, args)))
+        tasks.append(asyncio.create_task(self.flush_outboxes()))
+
+        loop.add_reader(self.p_q.fileno(), self.drain_primary_queue)
+        self.drain_primary_queue()
+
+        while True:
+            if not inbox:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+
+            self.route_reporting_errors(inbox.pop())
+            await asyncio.sleep(0)
+
+    def drain_primary_queue(self):
+        while True:
+            try:
+                self.inbox.push(self.p_q.get(False))
+            except queue.Empty:
+                break
+
+        if self.inbox:
+            self.wakeup.set()
+
+    async def flush_outboxes(self):
+        """
+        Moves actions held back in outboxes on to their remote queues as those drain. Runs on a timer rather than only
+        when the loop is idle, so held back actions keep moving while the primary is under sustained load.
+        """
+        while True:
+            await asyncio.sleep(OUTBOX_FLUSH_INTERVAL)
+
+            for outbox in self.outboxes.values():
+                if outbox:
+                    outbox.flush()
+
+    async def run_schedule(self, target: str, action_name: str, interval: float):
+        """Routes a scheduled action to a module every ``interval`` seconds, in turn with the rest of its actions."""
+        while True:
+            await asyncio.sleep(interval)
+            self.route_reporting_errors({
+                "target": target,
+                "action": action_name,
+                "payload": None,
+                "source": "schedule",
+            })
+
+    @staticmethod
+    async def run_job(interval: float, job, args: tuple):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await loop.run_in_executor(None, job, *args)
+            except Exception as e:
+                print(f"Scheduled job {job.__name__} error: {e}")
+                traceback.print_tb(e.__traceback__)
+
+    def sample_metrics(self) -> dict:
+        return {
+            "primary_queue_depth": self.p_q.qsize(),
+            "worker_inbox_depths": {target: worker.inbox.qsize() for target, worker in self.workers.items()},
+            "queues": self.queue_stats(),
+            "router": dict(self.counters),
+            "game_state": {
+                connection: dict(game_state.counters) for connection, game_state in list(self.ws_handlers.game_states.items())
+            },
+        }
+
+    def queue_stats(self) -> dict:
+        """Depths, high-water marks and drop/coalesce counts of the primary inbox lanes and remote outboxes."""
+        queue_stats = {f"primary.{lane}": lane_stats for lane, lane_stats in self.inbox.stats().items()}
+
+        for target, outbox in self.outboxes.items():
+            queue_stats[target] = outbox.stats()
+
+        return queue_stats
+
+    def route_game(self, action: dict):
+        """Routes a game action to the connection its trace came in on, or the first connection."""
+        trace = action.get("trace", None)
+        connection = trace.get("connection", None) if trace is not None else None
+
+        outbox = self.outboxes.get(connection_target(connection), None) if connection is not None else None
+        if outbox is None:
+            outbox = self.outboxes[connection_target(self.game_connections[0])]
+
+        outbox.put(action)
+
+    def unpack_batch(self, batch: dict):
+        """Routes each action carried by a batch envelope (see ``Utils.gen_batch_action``), in order."""
+        actions = batch["payload"]
+
+        self.counters["batches"] += 1
+        self.counters["batched_actions"] += len(actions)
+        self.counters["puts_saved"] += len(actions) - 1
+
+        trace = batch.get("trace", None)
+
+        for action in actions:
+            if trace is not None:
+                action.setdefault("trace", trace)
+            self.route(action)
+
+    def publish(self, message: dict):
+        """Delivers a published message (see ``Utils.gen_publish_action``) to each subscriber of its topic."""
+        topic = message["action"]
+        subscribers = self.topics.get(topic, [])
+
+        self.counters["published"] += 1
+
+        for handler, target, action_name, key_filter in subscribers:
+            payload = message["payload"]
+
+            if key_filter is not None:
+                payload = key_filter.select(payload)
+                self.counters["filtered_keys"] += len(message["payload"]) - len(payload)
+                if not payload:
+                    self.counters["filtered_deliveries"] += 1
+                    continue
+
+            self.counters["deliveries"] += 1
+
+            action = {
+                "target": target,
+                "action": action_name,
+                "payload": payload,
+                "source": message["source"],
+            }
+
+            if "trace" in message:
+                action["trace"] = message["trace"]
+
+            handler(action)
@@ -7,6 +7,7 @@ from datetime import datetime
 
 from repo import Repo
 from utils import Utils
+from metrics import instrumented
 
 
 class Stats:
@@ -30,7 +31,13 @@ class Stats:
                 "target": self.get_one_life_stats
             },
         }
+        # Topic: [dispatch map keys], see Router
+        self.subscriptions = {
+            "chat": ["handle_chat"],
+            "yell": ["handle_yell"],
+        }
 
+    @instrumented
     def dispatch(self, action: dict):
         target_dict = self.dispatch_map.get(action["action"], None)
 
@@ -62,13 +69,13 @@ class Stats:
         return stat_count, count_per_day, count_per_hour
 
     def handle_chat(self, action: dict):
-        # {'target': 'stats', 'action': 'handle_chat', 'payload': {'player': {'username': '', 'sigil': '', 'tag': '', 'level': '', 'perm_level': 0}, 'message': '', 'time': datetime}, 'source': 'chat'}
+        # {'target': 'stats', 'action': 'handle_chat', 'payload': {'player': {'username': '', 'sigil': '', 'tag': '', 'level': '', 'perm_level': 0}, 'message': '', 'time': int}, 'source': 'chat'}
         message_data = action["payload"]
         self.update_stats_from_chat(message_data)
         self.handle_dynamic_command(message_data)
 
     def handle_yell(self, action: dict):
-        # {'target': 'stats', 'action': 'handle_yell', 'payload': {'type': 'YELL', 'payload': '', 'time': datetime}, 'source': 'ws_handlers'}
+        # {'target': 'stats', 'action': 'handle_yell', 'payload': {'type': 'YELL', 'payload': '', 'time': int}, 'source': 'ws_handlers'}
         yell_data = action["payload"]
         yell_text = yell_data["payload"]
         yell_type = self.get_yell_type(yell_text)
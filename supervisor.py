@@ -0,0 +1,265 @@
+import asyncio
+import os
+import queue
+import time
+
+from multiprocessing.process import BaseProcess
+
+from metrics import registry
+from transport import ActionQueue
+
+# Restart backoff, in seconds. Doubles with each crash of a process that didn't stay up for STABLE_AFTER seconds.
+BACKOFF_INITIAL = 1
+BACKOFF_MAX = 60
+STABLE_AFTER = 60
+# How long to wait on a dead process' queue for more undelivered actions before giving up on it.
+SALVAGE_TIMEOUT = 0.05
+# How long a process asked to stop gets to exit by itself before it's killed.
+STOP_TIMEOUT = 5
+
+
+class Subsystem:
+    def __init__(self, name: str, factory, target: str | None):
+        self.name = name
+        self.factory = factory
+        self.target = target
+        self.process = None
+        self.wanted = False
+        self.started = None
+        self.down_since = None
+        self.downtime = 0.0
+        self.restarts = 0
+        self.salvaged = 0
+        self.backoff = BACKOFF_INITIAL
+        self.restart_handle = None
+        self.stopping = False
+        self.kill_handle = None
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class Supervisor:
+    """
+    Starts the bot's subsystem processes (Game, APIs, WebApp) and restarts any which exit without being asked to,
+    with exponential backoff so a crash loop (eg a reconnect storm) doesn't spin.
+
+    Process exits are picked up from each process' sentinel on the primary event loop, so everything here runs on the
+    loop thread, alongside the Router, and nothing here waits on a process. Stopping a process only asks it to exit,
+    whatever follows (eg starting it again) happens once its sentinel reports it gone. A subsystem fed by a Router outbox gets a fresh ActionQueue on every restart,
+    with whatever the dead process left undelivered on its old queue moved across first, as the old queue's locks may
+    have died with it.
+
+    Restart counts, salvaged actions and downtime are sampled into the metrics registry.
+    """
+    def __init__(self, router):
+        """
+        :param router: The primary Router. Its outboxes are re-pointed at the fresh queues of restarted processes.
+        :type router: router.Router
+        """
+        self.router = router
+        self.subsystems = {}
+
+        registry.add_sampler(self.sample_metrics)
+
+    def add(self, name: str, factory, target: str | None = None):
+        """
+        :param name: Subsystem name, eg "game"
+        :param factory: Called as ``factory(remote_queue)`` (``factory()`` if there's no target) to build a new,
+            unstarted Process.
+        :param target: Router target whose outbox feeds the process, if any.
+        """
+        self.subsystems[name] = Subsystem(name, factory, target)
+
+    def start(self, name: str):
+        subsystem = self.subsystems[name]
+        subsystem.wanted = True
+
+        if subsystem.is_alive():
+            return
+
+        self.spawn(subsystem)
+
+    def start_all(self):
+        for name in self.subsystems:
+            self.start(name)
+
+    def stop(self, name: str):
+        """Stops a subsystem, and keeps it stopped until it's started again."""
+        subsystem = self.subsystems[name]
+        subsystem.wanted = False
+        self.cancel_restart(subsystem)
+
+        if subsystem.is_alive():
+            self.terminate(subsystem)
+
+    def restart(self, name: str):
+        """Restarts a subsystem without backoff, as soon as the running process (if any) has exited."""
+        subsystem = self.subsystems[name]
+        subsystem.wanted = True
+        self.cancel_restart(subsystem)
+
+        subsystem.restarts += 1
+        registry.increment(f"supervisor.{name}.restarts")
+
+        if subsystem.is_alive():
+            # on_exit starts the new process
+            self.terminate(subsystem)
+        else:
+            self.spawn(subsystem)
+
+    def spawn(self, subsystem: Subsystem):
+        loop = asyncio.get_running_loop()
+
+        if subsystem.target is None:
+            process: BaseProcess = subsystem.factory()
+        else:
+            process = subsystem.factory(self.replace_queue(subsystem))
+
+        # Inherited by the child, for its launch to VALID_LOGIN timing. See Game.record_startup_time
+        os.environ["LUXBOT_SPAWNED_NS"] = str(time.monotonic_ns())
+        process.start()
+
+        if subsystem.down_since is not None:
+            subsystem.downtime += time.monotonic() - subsystem.down_since
+            subsystem.down_since = None
+
+        subsystem.process = process
+        subsystem.started = time.monotonic()
+        loop.add_reader(process.sentinel, self.on_exit, subsystem, process)
+
+    def terminate(self, subsystem: Subsystem):
+        """
+        Asks the process to stop with SIGTERM, which the entry points in main.py turn into a normal exit, so its queue
+        feeder threads finish their writes (and release the queues' locks) and its cleanup runs. Doesn't wait for it,
+        the loop keeps routing (and reading the primary queue those feeder threads may be writing to) meanwhile.
+        Only a process which hasn't exited within STOP_TIMEOUT is killed, see kill.
+        """
+        if subsystem.stopping:
+            return
+
+        process = subsystem.process
+        subsystem.stopping = True
+
+        process.terminate()
+        subsystem.kill_handle = asyncio.get_running_loop().call_later(STOP_TIMEOUT, self.kill, subsystem, process)
+
+    @staticmethod
+    def kill(subsystem: Subsystem, process: BaseProcess):
+        subsystem.kill_handle = None
+
+        if process.is_alive():
+            print(f"Supervisor: {subsystem.name} didn't stop within {STOP_TIMEOUT}s, killing it")
+            process.kill()
+
+    def on_exit(self, subsystem: Subsystem, process: BaseProcess):
+        asyncio.get_running_loop().remove_reader(process.sentinel)
+        process.join()
+
+        if process is not subsystem.process:
+            return
+
+        self.mark_down(subsystem)
+
+        if subsystem.stopping:
+            subsystem.stopping = False
+            if subsystem.kill_handle is not None:
+                subsystem.kill_handle.cancel()
+                subsystem.kill_handle = None
+
+            print(f"Supervisor: {subsystem.name} stopped with code {process.exitcode}")
+
+            # Asked to stop as part of a restart (or started again since)
+            if subsystem.wanted:
+                self.spawn(subsystem)
+            return
+
+        print(f"Supervisor: {subsystem.name} exited with code {process.exitcode}")
+
+        if not subsystem.wanted:
+            return
+
+        if time.monotonic() - subsystem.started >= STABLE_AFTER:
+            subsystem.backoff = BACKOFF_INITIAL
+
+        delay = subsystem.backoff
+        subsystem.backoff = min(subsystem.backoff * 2, BACKOFF_MAX)
+
+        print(f"Supervisor: Restarting {subsystem.name} in {delay}s")
+        subsystem.restart_handle = asyncio.get_running_loop().call_later(delay, self.restart_after_crash, subsystem)
+
+    def restart_after_crash(self, subsystem: Subsystem):
+        subsystem.restart_handle = None
+
+        if not subsystem.wanted or subsystem.is_alive():
+            return
+
+        subsystem.restarts += 1
+        registry.increment(f"supervisor.{subsystem.name}.restarts")
+        self.spawn(subsystem)
+
+    @staticmethod
+    def mark_down(subsystem: Subsystem):
+        if subsystem.down_since is None:
+            subsystem.down_since = time.monotonic()
+
+    @staticmethod
+    def cancel_restart(subsystem: Subsystem):
+        if subsystem.restart_handle is not None:
+            subsystem.restart_handle.cancel()
+            subsystem.restart_handle = None
+
+    def replace_queue(self, subsystem: Subsystem) -> ActionQueue:
+        """
+        Points the subsystem's outbox at a fresh ActionQueue, moving across anything still waiting on the old one.
+        Actions still held back in the outbox itself were never handed over, so they simply carry on from there.
+        """
+        outbox = self.router.outboxes[subsystem.target]
+        old_queue = outbox.remote_queue
+
+        if subsystem.process is None:
+            return old_queue
+
+        new_queue = ActionQueue(old_queue.name)
+        salvaged = 0
+
+        while True:
+            try:
+                new_queue.put(old_queue.get(timeout=SALVAGE_TIMEOUT))
+            except queue.Empty:
+                break
+            except Exception as e:
+                print(f"Supervisor: Couldn't salvage the rest of {subsystem.name}'s queue: {e}")
+                break
+            salvaged += 1
+
+        old_queue.close()
+        outbox.remote_queue = new_queue
+
+        subsystem.salvaged += salvaged
+        if salvaged:
+            print(f"Supervisor: Handed {salvaged} undelivered actions on to the new {subsystem.name} process")
+
+        return new_queue
+
+    def sample_metrics(self) -> dict:
+        now = time.monotonic()
+        subsystems = {}
+
+        for name, subsystem in self.subsystems.items():
+            downtime = subsystem.downtime
+            if subsystem.down_since is not None:
+                downtime += now - subsystem.down_since
+
+            subsystems[name] = {
+                "alive": subsystem.is_alive(),
+                "wanted": subsystem.wanted,
+                "pid": subsystem.process.pid if subsystem.process is not None else None,
+                "restarts": subsystem.restarts,
+                "salvaged_actions": subsystem.salvaged,
+                "downtime_s": round(downtime, 3),
+                "uptime_s": round(now - subsystem.started, 3) if subsystem.is_alive() else 0.0,
+                "next_backoff_s": subsystem.backoff,
+            }
+
+        return {"subsystems": subsystems}
@@ -2,6 +2,7 @@ from multiprocessing.queues import Queue
 
 from utils import Utils
 from repo import Repo
+from metrics import instrumented
 
 
 class TCG:
@@ -16,6 +17,10 @@ class TCG:
                 "target": self.handle_refresh_tcg
             }
         }
+        # Topic: [dispatch map keys], see Router
+        self.subscriptions = {
+            "refresh_tcg": ["handle_refresh_tcg"],
+        }
         self.custom_command_map = {
             "offer": {
                 "target": self.handle_trade_offer
@@ -87,8 +92,7 @@ class TCG:
             "source": "tcg",
         })
 
-        for action in actions:
-            self.p_q.put(action)
+        self.p_q.put(Utils.gen_batch_action(actions, "tcg"))
 
         self.card_owners.pop(trade["card_one"])
         self.card_owners.pop(trade["card_two"])
@@ -125,9 +129,9 @@ class TCG:
 
         actions.append(Utils.gen_send_action("custom", send_data))
 
-        for action in actions:
-            self.p_q.put(action)
+        self.p_q.put(Utils.gen_batch_action(actions, "tcg"))
 
+    @instrumented
     def dispatch(self, action: dict):
         target_dict = self.dispatch_map.get(action["action"], None)
 
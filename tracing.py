@@ -0,0 +1,56 @@
+import itertools
+import os
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# A context variable rather than a thread local, so each asyncio task on the primary loop has its own current trace.
+_current = ContextVar("trace", default=None)
+_trace_ids = itertools.count()
+
+
+def new_trace(connection: str | None = None) -> dict:
+    """
+    Starts a trace for an inbound websocket frame.
+
+    ``received`` is ``time.monotonic_ns()`` at ingest. The monotonic clock is system wide, so it can be compared
+    against in any of the bot's processes. ``command`` is filled in once Chat or Customs knows which command the
+    frame triggered. ``connection`` is the game connection the frame arrived on, replies are sent back through it.
+    """
+    trace = {
+        "id": f"{os.getpid():x}-{next(_trace_ids):x}",
+        "received": time.monotonic_ns(),
+        "command": None,
+        "connection": connection,
+    }
+
+    return trace
+
+
+def current() -> dict | None:
+    """Returns the trace of the action being handled on this thread or task, if it has one."""
+    return _current.get()
+
+
+@contextmanager
+def activate(trace: dict | None):
+    """
+    Makes ``trace`` current on this thread or task while an action is handled.
+    Any action put on an ActionQueue meanwhile carries the trace with it.
+    """
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def set_command(command: str):
+    trace = current()
+    if trace is not None:
+        trace["command"] = command
+
+
+def elapsed_ms(trace: dict) -> float:
+    return (time.monotonic_ns() - trace["received"]) / 1000000
@@ -0,0 +1,131 @@
+import marshal
+import multiprocessing
+import pickle
+import time
+
+from multiprocessing.queues import Queue
+
+import tracing
+
+from metrics import registry
+
+# Context every subsystem process, and every queue and shared value handed to one, is created with. The primary process
+# runs several threads (module workers, the metrics flush), and a child forked from it could inherit a lock one of
+# them held at that moment and deadlock on it. Spawned children start from a fresh interpreter instead.
+PROCESS_CONTEXT = multiprocessing.get_context("spawn")
+
+# Target, action and source names interned to their index in this tuple when sent over an ActionQueue.
+# Append only: every process has to agree on the codes. Names missing from here are still sent, just as strings.
+WIRE_NAMES = (
+    # Targets
+    "main", "game", "api", "batch", "publish", "ws_handlers", "custom", "chat", "fun", "mod", "admin", "stats",
+    "event", "integration", "tcg",
+    # Actions
+    "dispatch", "send", "send_ws_message", "set_items", "set_ws_active", "print_items", "unpack", "handle",
+    "parse_and_dispatch", "chat_mirror_webhook", "event_webhook", "paste", "yell", "event_global_progress",
+    "refresh_tcg", "received_whois", "main_start", "main_close", "main_restart",
+    # Sources
+    "webui", "webapp",
+)
+WIRE_CODES = {name: code for code, name in enumerate(WIRE_NAMES)}
+WIRE_NAMES_BY_CODE = dict(enumerate(WIRE_NAMES))
+
+MARSHAL_FORMAT = b"m"
+PICKLE_FORMAT = b"p"
+
+
+def encode_action(action: dict) -> bytes:
+    """
+    Encodes an action dict as an Action record: a ``(target, action, payload, source, sent, trace)`` tuple.
+    ``target``, ``action`` and ``source`` are WIRE_NAMES codes where one exists, ``sent`` is the ``time.monotonic_ns()``
+    the action was encoded at. The record carries the action's own trace, or failing that the trace current on this
+    thread.
+
+    Records are marshalled, which is smaller and quicker than pickle for the plain str/int/dict/list payloads actions
+    carry. A payload marshal can't handle falls back to pickle, the leading format byte says which was used.
+    """
+    target = action["target"]
+    action_name = action["action"]
+    source = action["source"]
+
+    record = (
+        WIRE_CODES.get(target, target),
+        WIRE_CODES.get(action_name, action_name),
+        action["payload"],
+        WIRE_CODES.get(source, source),
+        time.monotonic_ns(),
+        action.get("trace", None) or tracing.current(),
+    )
+
+    try:
+        return MARSHAL_FORMAT + marshal.dumps(record)
+    except ValueError:
+        return PICKLE_FORMAT + pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+
+
+def decode_action(data: bytes, hop_metric: str = None) -> dict:
+    """
+    Decodes an encoded Action record straight back to an action dict.
+    :param hop_metric: Histogram to record the time since the record was encoded in, if any.
+    """
+    if data[0] == MARSHAL_FORMAT[0]:
+        target, action_name, payload, source, sent, trace = marshal.loads(memoryview(data)[1:])
+    else:
+        target, action_name, payload, source, sent, trace = pickle.loads(memoryview(data)[1:])
+
+    if hop_metric is not None:
+        # monotonic_ns is system wide on Linux, so it's comparable between the sending and receiving processes
+        registry.observe(hop_metric, (time.monotonic_ns() - sent) / 1000000)
+
+    action = {
+        "target": WIRE_NAMES_BY_CODE.get(target, target),
+        "action": WIRE_NAMES_BY_CODE.get(action_name, action_name),
+        "payload": payload,
+        "source": WIRE_NAMES_BY_CODE.get(source, source),
+    }
+
+    if trace is not None:
+        action["trace"] = trace
+
+    return action
+
+
+class ActionQueue(Queue):
+    """
+    Pipe backed queue used to pass actions between the primary, Game, APIs and WebApp processes.
+
+    A ``Manager().Queue()`` proxy turns every put/get into a pickled RPC round-trip to the separate Manager server
+    process. An ActionQueue is a plain OS pipe instead: ``put`` hands the action to a feeder thread in the sending
+    process which writes it straight into the pipe, and ``get`` reads it straight out of the other end.
+    Actions cross the pipe as encoded Action records, see ``encode_action``.
+
+    Interface is the same as the Manager queues it replaces (``put``, ``get``, ``get(False)`` raising ``queue.Empty``).
+    It must be handed to child processes when they are created, not sent over another queue.
+
+    A named queue records how long each action took from ``put`` to ``get`` in the receiving process' registry, as the
+    ``queue_hop.<name>`` histogram.
+    """
+    def __init__(self, name: str = None, maxsize: int = 0):
+        """
+        :param name: Name the queue's hop latency is recorded under, eg "primary" or "game:main". Not recorded if None.
+        """
+        super().__init__(maxsize, ctx=PROCESS_CONTEXT)
+        self.name = name
+        self.hop_metric = f"queue_hop.{name}" if name is not None else None
+
+    def __getstate__(self):
+        return super().__getstate__(), self.name, self.hop_metric
+
+    def __setstate__(self, state):
+        queue_state, self.name, self.hop_metric = state
+        super().__setstate__(queue_state)
+
+    def put(self, action: dict, block: bool = True, timeout: float = None):
+        super().put(encode_action(action), block, timeout)
+
+    def get(self, block: bool = True, timeout: float = None) -> dict:
+        return decode_action(super().get(block, timeout), self.hop_metric)
+
+    def fileno(self) -> int:
+        """Return the read end of the pipe, so a consumer can wait on it with a selector or event dispatcher."""
+        return self._reader.fileno()
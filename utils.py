@@ -1,5 +1,4 @@
 import os
-import requests
 
 from threading import Timer
 
@@ -22,6 +21,8 @@ class Utils:
             "api_paste_expire_date": expiry
         }
 
+        import requests
+
         response = requests.post(url=url, data=data)
 
         return response.text
@@ -47,6 +48,40 @@ class Utils:
 
         return send_action
 
+    @staticmethod
+    def gen_batch_action(actions: list, source: str) -> dict:
+        """
+        Wraps several actions in a single envelope so they cost one queue put instead of one each.
+        The primary handler unpacks the envelope and routes each action in order.
+        A single action is returned as-is, there's nothing to save by wrapping it.
+        """
+        if len(actions) == 1:
+            return actions[0]
+
+        batch_action = {
+            "target": "batch",
+            "action": "unpack",
+            "payload": actions,
+            "source": source,
+        }
+
+        return batch_action
+
+    @staticmethod
+    def gen_publish_action(topic: str, payload, source: str) -> dict:
+        """
+        Publishes ``payload`` to ``topic``. The router delivers it to every module subscribed to the topic,
+        see the ``subscriptions`` of each module.
+        """
+        publish_action = {
+            "target": "publish",
+            "action": topic,
+            "payload": payload,
+            "source": source,
+        }
+
+        return publish_action
+
     @staticmethod
     def gen_mute_action(target, length, reason, is_ip):
         mute_data = f"MUTE={target}~{length}~{reason}~{is_ip}"
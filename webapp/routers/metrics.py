@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, Request, HTTPException
+
+from ..internal import security
+
+router = APIRouter(
+    prefix="/metrics",
+    dependencies=[Depends(security.get_current_active_user)],
+    tags=["metrics"]
+)
+
+
+@router.get("/")
+async def get_metrics(request: Request, process: str | None = None) -> dict:
+    all_metrics = request.app.db.read_metrics()
+
+    if process:
+        process_metrics = all_metrics.get(process, None)
+        if process_metrics is None:
+            raise HTTPException(status_code=204, detail="No metrics recorded for that process.")
+        else:
+            return {process: process_metrics}
+    else:
+        return all_metrics
+
+
+@router.get("/dispatch")
+async def get_dispatch_times(request: Request, limit: int = 20) -> list[dict]:
+    """Handlers across all processes, ordered by the total time spent in them."""
+    all_metrics = request.app.db.read_metrics()
+
+    dispatch_times = []
+    for process, process_metrics in all_metrics.items():
+        for key, dispatch_stats in process_metrics["dispatch"].items():
+            dispatch_times.append(dict(dispatch_stats, process=process, action=key))
+
+    dispatch_times.sort(key=lambda dispatch_stats: dispatch_stats["total_ms"], reverse=True)
+
+    return dispatch_times[:limit]
@@ -4,15 +4,21 @@ from multiprocessing import Queue
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 
-from .routers import admin, chat, custom, pet, mod, stats
+from .routers import admin, chat, custom, pet, mod, stats, metrics
 from .internal import security
 
-from repo import Repo
+from repo import Repo, permission_cache
+from metrics import registry
 
 
 class WebApp:
-    def __init__(self, p_q: Queue):
+    def __init__(self, p_q: Queue, permission_generation=None):
+        """
+        :param permission_generation: The primary process' permission cache generation counter, see
+            repo.PermissionCache
+        """
         self.p_q = p_q
+        self.permission_generation = permission_generation
         self.test_data = "cube"
 
     def run(self):
@@ -25,6 +31,9 @@ class WebApp:
 
         app.p_q = self.p_q
         app.db = Repo()
+        if self.permission_generation is not None:
+            permission_cache.share(self.permission_generation)
+        registry.start_flushing("webapp")
 
         app.mount("/ui/", StaticFiles(directory="./webapp/static/ui", html=True), name="ui")
 
@@ -35,5 +44,6 @@ class WebApp:
         app.include_router(pet.router)
         app.include_router(mod.router)
         app.include_router(stats.router)
+        app.include_router(metrics.router)
 
         uvicorn.run(app, host="127.0.0.1", port=8080, log_level="info")
@@ -1,10 +1,16 @@
 from multiprocessing.queues import Queue
 
+from game_state import GameState
+from utils import Utils
+from metrics import instrumented
+
 
 class WSHandlers:
     def __init__(self, p_q: Queue):
         self.dispatch_map = {}
         self.p_q = p_q
+        # Connection ID: GameState, each account has its own items.
+        self.game_states = {}
 
     def apply_dispatch_map(self, new_map: dict = None):
         if new_map is not None:
@@ -40,6 +46,7 @@ class WSHandlers:
                 },
             }
 
+    @instrumented
     def dispatch(self, action: dict):
         message = action["payload"]
         message_type = message["type"]
@@ -68,29 +75,7 @@ class WSHandlers:
         self.p_q.put(action)
 
     def on_yell(self, message: dict):
-        actions = [
-            {
-                "target": "stats",
-                "action": "handle_yell",
-                "payload": message,
-                "source": "ws_handlers",
-            },
-            {
-                "target": "fun",
-                "action": "handle_yell",
-                "payload": message,
-                "source": "ws_handlers",
-            },
-            {
-                "target": "integration",
-                "action": "mirror_yell_to_discord",
-                "payload": message,
-                "source": "ws_handlers",
-            },
-        ]
-
-        for action in actions:
-            self.p_q.put(action)
+        self.p_q.put(Utils.gen_publish_action("yell", message, "ws_handlers"))
 
     def on_custom(self, message: dict):
         action = {
@@ -102,35 +87,15 @@ class WSHandlers:
         self.p_q.put(action)
 
     def on_set_items(self, message: dict):
-        split_vars = message["payload"].split("~")
-        parsed_vars = {}
-        for i in range(0, len(split_vars), 2):
-            key = split_vars[i]
-            value = split_vars[i+1]
-            if value.isnumeric():
-                value = int(value)
-            else:
-                if value[0] == "-":
-                    if value[1:].isnumeric():
-                        value = -abs(int(value[1:]))
-            parsed_vars[key] = value
-
-        actions = [
-            {
-                "target": "game",
-                "action": "set_items",
-                "payload": parsed_vars,
-                "source": "ws_handlers",
-            },
-            {
-                "target": "event",
-                "action": "handle_set_items",
-                "payload": parsed_vars,
-                "source": "ws_handlers",
-            }
-        ]
-        for action in actions:
-            self.p_q.put(action)
+        game_state = self.game_states.get(message.get("connection", None), None)
+        if game_state is None:
+            game_state = self.game_states[message.get("connection", None)] = GameState()
+
+        # Only what changed is published, see GameState
+        changed_vars = game_state.update_frame(message["payload"])
+
+        if changed_vars:
+            self.p_q.put(Utils.gen_publish_action("set_items", changed_vars, "ws_handlers"))
 
     def on_dialogue(self, message: dict):
         data = message["payload"]
@@ -157,6 +122,11 @@ class WSHandlers:
 
     def on_valid_login(self, message: dict):
         print("Signature verified. Login Successful.")
+        # A (re)started Game process has none of the items yet, so the full SET_ITEMS after login must all go through
+        game_state = self.game_states.get(message.get("connection", None), None)
+        if game_state is not None:
+            game_state.reset()
+
         action = {
             "target": "game",
             "action": "set_ws_active",
@@ -166,25 +136,13 @@ class WSHandlers:
         self.p_q.put(action)
 
     def on_event_global_progress(self, message: dict):
-        action = {
-            "target": "event",
-            "action": "handle_event_progress",
-            "payload": message,
-            "source": "ws_handlers",
-        }
-        self.p_q.put(action)
+        self.p_q.put(Utils.gen_publish_action("event_global_progress", message, "ws_handlers"))
 
     def on_refresh_tcg(self, message: dict):
-        action = {
-            "target": "tcg",
-            "action": "handle_refresh_tcg",
-            "payload": message,
-            "source": "ws_handlers",
-        }
-        self.p_q.put(action)
+        self.p_q.put(Utils.gen_publish_action("refresh_tcg", message, "ws_handlers"))
 
     def on_update_timer(self, message: dict):
+        # The Game process only forwards every tenth UPDATE_TIMER, see ingress.INGRESS_FILTERS
         raw_data = message["payload"]
         update_time = int(raw_data.split()[-1])
-        if update_time % 10 == 0:
-            print(f"Update timer: {update_time}")
+        print(f"Update timer: {update_time}")